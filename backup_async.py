@@ -0,0 +1,396 @@
+import os
+import json
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+from config import Config
+from backup_manager import BackupCancelled, BackupManager
+from backup_engines import get_engine
+
+# Job states that will not change any more
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+class BackupConflictError(ValueError):
+    """Raised when a job cannot start because a conflicting job is running"""
+
+
+class BackupJob:
+    """A backup or restore running in an executor, observable from asyncio
+    
+    Progress, phase and status events are kept in ``events`` and can be
+    followed with ``async for event in job``. ``cancel`` asks the job to
+    stop at the next chunk boundary.
+    """
+    
+    def __init__(self, kind, description):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.description = description
+        self.status = 'pending'
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {'rows': 0, 'tables': {}}
+        self.events = []
+        self.cancel_event = threading.Event()
+        self._exception = None
+        self._changed = asyncio.Event()
+        self._task = None
+    
+    def __aiter__(self):
+        return self.follow()
+    
+    async def follow(self):
+        """Yield every event of the job, from the first, until it finishes"""
+        
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            
+            if self.status in FINISHED_STATES:
+                return
+            await changed.wait()
+    
+    async def wait(self):
+        """Wait for the job and return its result, raising its error if it failed"""
+        
+        await asyncio.shield(self._task)
+        
+        if self.status == 'cancelled':
+            raise BackupCancelled(self.error)
+        if self.status == 'failed':
+            raise self._exception
+        return self.result
+    
+    def cancel(self):
+        """Ask the job to stop; returns False if it has already finished"""
+        
+        if self.status in FINISHED_STATES:
+            return False
+        self.cancel_event.set()
+        return True
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'description': self.description,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': self.progress
+        }
+    
+    def _publish(self, event):
+        """Record an event and wake up followers (event loop thread only)"""
+        
+        event = dict(event, job=self.id)
+        
+        if event['type'] == 'progress':
+            if event.get('table'):
+                tables = self.progress['tables']
+                tables[event['table']] = tables.get(event['table'], 0) + event['rows']
+                self.progress['rows'] += event['rows']
+            else:
+                self.progress.update((key, value) for key, value in event.items() if key not in ('type', 'job'))
+        
+        self.events.append(event)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class AsyncBackupManager:
+    """asyncio interface to BackupManager
+    
+    Backups and restores run on a thread pool, each with its own
+    ``BackupManager``, so the event loop never blocks. Exports may run
+    side by side, but a restore excludes every other job; a conflicting
+    job is rejected with ``BackupConflictError``. Cancelling a job, or the
+    task awaiting ``export``/``restore``, stops it between chunks and
+    removes its partial backup file; a cancelled restore leaves the live
+    database untouched.
+    """
+    
+    def __init__(self, db_path='qat_app.db', max_workers=None):
+        self.db_path = db_path
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or Config.BACKUP_JOB_WORKERS)
+        self.jobs = OrderedDict()
+        self._running = {'export': 0, 'restore': 0}
+        self._lock = threading.Lock()
+    
+    async def export(self, engine='ndjson', **options):
+        """Take a backup with a registered engine and return its path"""
+        
+        return await self._wait(self.start_export(engine, **options))
+    
+    async def restore(self, backup_path, **options):
+        """Restore a backup and return the per-table load statistics"""
+        
+        return await self._wait(self.start_restore(backup_path, **options))
+    
+    def start_export(self, engine='ndjson', **options):
+        """Start a backup without waiting for it and return its BackupJob"""
+        
+        # Fail fast on unknown engines
+        get_engine(engine)
+        return self._start('export', f'{engine} export', lambda manager: manager.export(engine, **options))
+    
+    def start_restore(self, backup_path, **options):
+        """Start a restore without waiting for it and return its BackupJob
+        
+        ``options`` are passed to ``restore_from_backup``, e.g. ``tables``
+        and ``where`` for a partial restore.
+        """
+        
+        if not os.path.exists(backup_path):
+            raise ValueError(f"Backup file not found: {backup_path}")
+        return self._start('restore', f'restore {os.path.basename(backup_path)}',
+                           lambda manager: manager.restore_from_backup(backup_path, **options))
+    
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+    
+    async def _wait(self, job):
+        try:
+            return await job.wait()
+        except asyncio.CancelledError:
+            # The caller gave up, so stop the work too
+            job.cancel()
+            raise
+    
+    def _start(self, kind, description, work):
+        with self._lock:
+            if self._running['restore'] or (kind == 'restore' and self._running['export']):
+                raise BackupConflictError("A conflicting backup job is already running")
+            self._running[kind] += 1
+        
+        job = BackupJob(kind, description)
+        self.jobs[job.id] = job
+        
+        # Forget the oldest finished jobs
+        while len(self.jobs) > Config.BACKUP_JOB_HISTORY:
+            oldest = next((j for j in self.jobs.values() if j.status in FINISHED_STATES), None)
+            if oldest is None:
+                break
+            del self.jobs[oldest.id]
+        
+        job._task = asyncio.get_running_loop().create_task(self._run(job, work))
+        return job
+    
+    async def _run(self, job, work):
+        loop = asyncio.get_running_loop()
+        
+        def publish(event):
+            loop.call_soon_threadsafe(job._publish, event)
+        
+        def execute():
+            if job.cancel_event.is_set():
+                raise BackupCancelled("Backup job was cancelled")
+            
+            loop.call_soon_threadsafe(self._set_running, job)
+            manager = BackupManager(self.db_path)
+            manager.cancel_event = job.cancel_event
+            manager.progress = lambda progress: publish(dict(progress, type='progress'))
+            manager.add_observer(lambda event: publish(dict(event, type='phase')))
+            
+            try:
+                return work(manager)
+            except BaseException:
+                manager._discard_partial_backups()
+                raise
+        
+        future = loop.run_in_executor(self.executor, execute)
+        
+        try:
+            try:
+                job.result = await asyncio.shield(future)
+                job.status = 'done'
+            except asyncio.CancelledError:
+                # Let the worker reach a chunk boundary before reporting
+                job.cancel()
+                await asyncio.wait([future])
+                raise
+        except BaseException as e:
+            job._exception = e
+            job.error = str(e) or type(e).__name__
+            job.status = 'cancelled' if job.cancel_event.is_set() else 'failed'
+            if isinstance(e, asyncio.CancelledError):
+                job.error = "Backup job was cancelled"
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            with self._lock:
+                self._running[job.kind] -= 1
+            job._publish({'type': job.status, 'result': job.result, 'error': job.error})
+    
+    def _set_running(self, job):
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+        job._publish({'type': 'running'})
+
+
+async def serve(manager=None, host=None, port=None):
+    """Serve backup jobs over HTTP on the event loop
+    
+    Routes (all require an admin JWT in ``Authorization: Bearer``):
+    
+    - ``POST /api/admin/backup/jobs`` with ``{"engine": ..., "options": {...}}``
+      or ``{"restore": "<backup filename>", "options": {...}}`` starts a
+      job (202)
+    - ``GET /api/admin/backup/jobs/<id>`` returns the job's state
+    - ``GET /api/admin/backup/jobs/<id>/events`` streams its events as
+      server-sent events until it finishes
+    - ``DELETE /api/admin/backup/jobs/<id>`` cancels it
+    
+    Requests are handled as coroutines, so polling and streaming never hold
+    a worker while a backup runs. Returns the ``asyncio.Server``.
+    """
+    
+    manager = manager or AsyncBackupManager()
+    
+    async def handle(reader, writer):
+        try:
+            await _handle_request(manager, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    return await asyncio.start_server(handle, host or Config.BACKUP_API_HOST, port or Config.BACKUP_API_PORT)
+
+
+async def _handle_request(manager, reader, writer):
+    """Parse one HTTP/1.1 request and route it"""
+    
+    request_line = (await reader.readline()).decode('latin-1').split()
+    if len(request_line) != 3:
+        return await _respond(writer, 400, {'error': 'Bad request'})
+    method, target = request_line[0], urlsplit(request_line[1]).path.rstrip('/')
+    
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    
+    # Before the body is read, so unauthenticated clients cannot make it buffer anything
+    error = _authorize(headers.get('authorization', ''))
+    if error:
+        return await _respond(writer, *error)
+    
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        return await _respond(writer, 400, {'error': 'Invalid Content-Length'})
+    if length < 0:
+        return await _respond(writer, 400, {'error': 'Invalid Content-Length'})
+    if length > Config.MAX_CONTENT_LENGTH:
+        return await _respond(writer, 413, {'error': 'Request body too large'})
+    
+    body = {}
+    if length:
+        try:
+            body = json.loads(await reader.readexactly(length))
+        except ValueError:
+            return await _respond(writer, 400, {'error': 'Invalid JSON body'})
+    if not isinstance(body, dict) or not isinstance(body.get('options', {}), dict):
+        return await _respond(writer, 400, {'error': 'Request body and options must be JSON objects'})
+    
+    prefix = '/api/admin/backup/jobs'
+    if not target.startswith(prefix):
+        return await _respond(writer, 404, {'error': 'Not found'})
+    parts = target[len(prefix):].strip('/').split('/') if target != prefix else []
+    
+    if method == 'POST' and not parts:
+        try:
+            if body.get('restore'):
+                # Only files inside the backup directory can be restored
+                path = os.path.join(Config.BACKUP_DIR, os.path.basename(body['restore']))
+                job = manager.start_restore(path, **body.get('options', {}))
+            else:
+                job = manager.start_export(body.get('engine', 'ndjson'), **body.get('options', {}))
+        except BackupConflictError as e:
+            return await _respond(writer, 409, {'error': str(e)})
+        except (ValueError, TypeError) as e:
+            return await _respond(writer, 400, {'error': str(e)})
+        return await _respond(writer, 202, {'success': True, 'job': job.to_dict()})
+    
+    job = manager.get_job(parts[0]) if parts else None
+    if job is None:
+        return await _respond(writer, 404, {'error': 'Job not found'})
+    
+    if method == 'GET' and len(parts) == 1:
+        return await _respond(writer, 200, {'success': True, 'job': job.to_dict()})
+    
+    if method == 'DELETE' and len(parts) == 1:
+        cancelled = job.cancel()
+        return await _respond(writer, 202 if cancelled else 409, {'success': cancelled, 'job': job.to_dict()})
+    
+    if method == 'GET' and parts[1:] == ['events']:
+        writer.write(
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: text/event-stream\r\n'
+            b'Cache-Control: no-cache\r\n'
+            b'Connection: close\r\n\r\n'
+        )
+        async for event in job:
+            writer.write(f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n".encode('utf-8'))
+            await writer.drain()
+        return
+    
+    return await _respond(writer, 405, {'error': 'Method not allowed'})
+
+
+async def _respond(writer, status, payload):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+    reasons = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden',
+               404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large'}
+    writer.write(
+        f'HTTP/1.1 {status} {reasons.get(status, "")}\r\n'
+        f'Content-Type: application/json; charset=utf-8\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f'Connection: close\r\n\r\n'.encode('latin-1') + body
+    )
+    await writer.drain()
+
+
+def _authorize(authorization):
+    """Return None for an admin bearer token, otherwise ``(status, payload)``"""
+    
+    # Only needed when the endpoint is served
+    import jwt
+    
+    token = authorization.replace('Bearer ', '', 1).strip()
+    if not token:
+        return 401, {'error': 'Access denied'}
+    
+    try:
+        user = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
+    except jwt.PyJWTError:
+        return 403, {'error': 'Invalid token'}
+    
+    if user.get('role') != 'admin':
+        return 403, {'error': 'Admin access required'}
+    return None
+
+
+if __name__ == '__main__':
+    async def main():
+        server = await serve()
+        async with server:
+            await server.serve_forever()
+    
+    asyncio.run(main())
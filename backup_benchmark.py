@@ -0,0 +1,341 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import platform
+import multiprocessing
+from datetime import datetime, timedelta
+from config import Config
+
+# Total rows generated for each dataset scale
+SCALES = {'10k': 10000, '1m': 1000000, '10m': 10000000}
+# Share of the generated rows that goes to each table
+TABLE_SHARES = {'users': 0.05, 'products': 0.10, 'orders': 0.40, 'transactions': 0.45}
+# Export benchmarks: BackupManager method and keyword arguments
+EXPORTS = {
+    'excel': ('export_to_excel', {}),
+    'json': ('export_to_json', {}),
+    'ndjson': ('export_to_json', {'ndjson': True}),
+    'ndjson.gz': ('export_to_json', {'ndjson': True, 'compress': 'gzip'}),
+    'parallel': ('export_parallel', {}),
+    'snapshot': ('export_snapshot', {'sleep': 0}),
+    'incremental': ('export_incremental', {'full': True}),
+    'deduplicated': ('export_deduplicated', {}),
+    'csv': ('export', {'engine': 'csv'})
+}
+
+SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY, name TEXT, email TEXT, phone TEXT, password TEXT,
+    role TEXT, storeName TEXT, walletBalance REAL, rating REAL, totalSales REAL,
+    isActive INTEGER, createdAt TEXT, updatedAt TEXT
+);
+CREATE TABLE products (
+    id INTEGER PRIMARY KEY, sellerId INTEGER, name TEXT, description TEXT,
+    price REAL, originalPrice REAL, category TEXT, quantity INTEGER,
+    marketId INTEGER, images TEXT, rating REAL, totalSold INTEGER,
+    isActive INTEGER, requiresWashing INTEGER, washingPrice REAL,
+    createdAt TEXT, updatedAt TEXT
+);
+CREATE TABLE orders (
+    id INTEGER PRIMARY KEY, buyerId INTEGER, items TEXT, totalAmount REAL,
+    discount REAL, deliveryAddress TEXT, paymentMethod TEXT, status TEXT,
+    paymentStatus TEXT, orderCode TEXT, driverId INTEGER, createdAt TEXT,
+    updatedAt TEXT
+);
+CREATE TABLE transactions (
+    id INTEGER PRIMARY KEY, userId INTEGER, orderId INTEGER, type TEXT,
+    amount REAL, status TEXT, createdAt TEXT, updatedAt TEXT
+);
+CREATE INDEX idx_products_seller ON products (sellerId);
+CREATE INDEX idx_orders_buyer ON orders (buyerId);
+CREATE INDEX idx_transactions_user ON transactions (userId);
+"""
+
+CATEGORIES = ('قات صبري', 'قات همداني', 'قات شامي', 'قات أرحبي', 'قات بلدي')
+ORDER_STATUSES = ('pending', 'confirmed', 'washing', 'delivering', 'delivered', 'cancelled')
+TRANSACTION_TYPES = ('deposit', 'purchase', 'sale', 'withdrawal', 'refund')
+
+
+def generate_dataset(db_path, rows, seed=0, batch_size=10000):
+    """Build a ``qat_app.db``-like fixture with about ``rows`` rows in total
+    
+    Users, products, orders and transactions are generated in the shapes
+    the server stores them in, with deterministic pseudo-random values for a
+    given ``seed``, so fixtures of the same size are identical across runs.
+    """
+    
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    
+    rng = random.Random(seed)
+    counts = {table_name: max(1, int(rows * share)) for table_name, share in TABLE_SHARES.items()}
+    epoch = datetime(2025, 1, 1)
+    
+    def timestamps():
+        created = epoch + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        updated = created + timedelta(seconds=rng.randrange(30 * 24 * 3600))
+        return created.isoformat(), updated.isoformat()
+    
+    def users():
+        for i in range(1, counts['users'] + 1):
+            role = rng.choice(('buyer', 'buyer', 'buyer', 'seller', 'driver'))
+            yield (
+                i, f'مستخدم {i}', f'user{i}@qat.com', f'77{rng.randrange(10 ** 7):07d}',
+                '$2a$10$' + '%053x' % rng.getrandbits(212), role,
+                f'متجر {i}' if role == 'seller' else None,
+                round(rng.uniform(0, 50000), 2), round(rng.uniform(0, 5), 1),
+                round(rng.uniform(0, 500000), 2) if role == 'seller' else 0,
+                1, *timestamps()
+            )
+    
+    def products():
+        for i in range(1, counts['products'] + 1):
+            price = round(rng.uniform(500, 20000), 2)
+            yield (
+                i, rng.randint(1, counts['users']), f'{rng.choice(CATEGORIES)} {i}',
+                'قات طازج من المزرعة مباشرة', price, price, rng.choice(CATEGORIES),
+                rng.randint(0, 500), rng.randint(1, 20), json.dumps([f'{i}.jpg']),
+                round(rng.uniform(0, 5), 1), rng.randint(0, 5000), 1,
+                rng.random() < 0.3, 100.0, *timestamps()
+            )
+    
+    def orders():
+        for i in range(1, counts['orders'] + 1):
+            items = [
+                {'productId': rng.randint(1, counts['products']), 'quantity': rng.randint(1, 5)}
+                for _ in range(rng.randint(1, 4))
+            ]
+            status = rng.choice(ORDER_STATUSES)
+            yield (
+                i, rng.randint(1, counts['users']), json.dumps(items),
+                round(rng.uniform(1000, 100000), 2), 0.0, f'صنعاء - شارع {rng.randint(1, 60)}',
+                rng.choice(('wallet', 'cash')), status,
+                'paid' if status != 'cancelled' else 'refunded', f'QAT{i:08d}',
+                rng.randint(1, counts['users']) if status in ('delivering', 'delivered') else None,
+                *timestamps()
+            )
+    
+    def transactions():
+        for i in range(1, counts['transactions'] + 1):
+            yield (
+                i, rng.randint(1, counts['users']), rng.randint(1, counts['orders']),
+                rng.choice(TRANSACTION_TYPES), round(rng.uniform(100, 100000), 2),
+                rng.choice(('pending', 'completed', 'completed', 'completed')), *timestamps()
+            )
+    
+    generators = {'users': users, 'products': products, 'orders': orders, 'transactions': transactions}
+    conn = sqlite3.connect(db_path)
+    
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(SCHEMA)
+        
+        for table_name, generate in generators.items():
+            placeholders = None
+            batch = []
+            for row in generate():
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    placeholders = placeholders or ', '.join(['?'] * len(row))
+                    conn.executemany(f"INSERT INTO {table_name} VALUES ({placeholders})", batch)
+                    batch = []
+            if batch:
+                placeholders = placeholders or ', '.join(['?'] * len(batch[0]))
+                conn.executemany(f"INSERT INTO {table_name} VALUES ({placeholders})", batch)
+            conn.commit()
+    finally:
+        conn.close()
+    
+    return counts
+
+
+def _measure(workdir, db_path, operation, fmt, backup_path, queue):
+    """Run one benchmark in a fresh process and report its measurements"""
+    
+    import resource
+    
+    # Backups land in the work directory, not next to the real ones
+    os.chdir(workdir)
+    from backup_manager import BackupManager
+    
+    manager = BackupManager(db_path)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    started = time.perf_counter()
+    
+    try:
+        if operation == 'export':
+            method, kwargs = EXPORTS[fmt]
+            result_path = getattr(manager, method)(**kwargs)
+            size = os.path.getsize(result_path)
+        else:
+            manager.restore_from_backup(backup_path)
+            result_path = backup_path
+            size = os.path.getsize(backup_path)
+        
+        seconds = time.perf_counter() - started
+        queue.put({
+            'path': result_path,
+            'seconds': seconds,
+            'bytes': size,
+            'rss_before_bytes': rss_before,
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+        })
+    except Exception as e:
+        queue.put({'error': str(e)})
+
+
+def _run_isolated(workdir, db_path, operation, fmt, backup_path=None):
+    """Run a benchmark in a spawned process so peak RSS covers only that operation"""
+    
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(workdir, db_path, operation, fmt, backup_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    
+    if 'error' in result:
+        raise ValueError(f"{operation} {fmt} failed: {result['error']}")
+    return result
+
+
+def run_benchmarks(scale='10k', formats=None, restore=True, workdir=None, reuse=False, seed=0):
+    """Benchmark every export format, and restoring from it, on a generated dataset
+    
+    Returns a JSON-serializable report with wall time, throughput and peak
+    RSS of each operation. Each operation runs in its own process, and
+    ``rss_before_bytes`` is its RSS after imports, before the operation.
+    """
+    
+    rows = SCALES[scale] if scale in SCALES else int(scale)
+    formats = formats or list(EXPORTS)
+    workdir = os.path.abspath(workdir or Config.BACKUP_BENCHMARK_DIR)
+    os.makedirs(workdir, exist_ok=True)
+    
+    fixture_path = os.path.join(workdir, f'fixture_{rows}_{seed}.db')
+    db_path = os.path.join(workdir, 'qat_app.db')
+    
+    if not (reuse and os.path.exists(fixture_path)):
+        started = time.perf_counter()
+        generate_dataset(fixture_path, rows, seed)
+        print(f"Generated {rows} rows in {time.perf_counter() - started:.1f}s")
+    
+    conn = sqlite3.connect(fixture_path)
+    try:
+        total_rows = sum(
+            conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0] for table_name in TABLE_SHARES
+        )
+    finally:
+        conn.close()
+    
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'scale': scale,
+        'rows': total_rows,
+        'results': []
+    }
+    
+    def record(operation, fmt, result):
+        seconds = result['seconds']
+        entry = {
+            'name': f'{operation}:{fmt}',
+            'operation': operation,
+            'format': fmt,
+            'rows': total_rows,
+            'seconds': seconds,
+            'rows_per_sec': total_rows / seconds if seconds else None,
+            'bytes': result['bytes'],
+            'bytes_per_sec': result['bytes'] / seconds if seconds else None,
+            'rss_before_bytes': result['rss_before_bytes'],
+            'peak_rss_bytes': result['peak_rss_bytes']
+        }
+        report['results'].append(entry)
+        print(f"{entry['name']:<24} {seconds:8.2f}s {entry['rows_per_sec'] or 0:12.0f} rows/s "
+              f"{entry['peak_rss_bytes'] / 2 ** 20:8.1f} MiB")
+    
+    for fmt in formats:
+        if fmt not in EXPORTS:
+            raise ValueError(f"Unknown benchmark format: {fmt}")
+        
+        # Every format starts from a clean copy of the fixture and backup directory
+        shutil.rmtree(os.path.join(workdir, Config.BACKUP_DIR), ignore_errors=True)
+        shutil.copyfile(fixture_path, db_path)
+        
+        exported = _run_isolated(workdir, db_path, 'export', fmt)
+        record('export', fmt, exported)
+        
+        if restore:
+            restored = _run_isolated(workdir, db_path, 'restore', fmt, exported['path'])
+            record('restore', fmt, restored)
+    
+    return report
+
+
+def compare(report, baseline, tolerance=0.1):
+    """Return the results of ``report`` that are slower or use more memory than ``baseline``
+    
+    A result regresses when its wall time or peak RSS exceeds the baseline
+    result of the same name by more than ``tolerance`` (a fraction).
+    """
+    
+    previous = {result['name']: result for result in baseline['results']}
+    regressions = []
+    
+    for result in report['results']:
+        before = previous.get(result['name'])
+        if before is None:
+            continue
+        
+        for metric in ('seconds', 'peak_rss_bytes'):
+            if result[metric] > before[metric] * (1 + tolerance):
+                regressions.append({
+                    'name': result['name'],
+                    'metric': metric,
+                    'baseline': before[metric],
+                    'value': result[metric],
+                    'change': result[metric] / before[metric] - 1
+                })
+    
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark BackupManager exports and restores')
+    parser.add_argument('--scale', default='10k', help='10k, 1m, 10m or a row count')
+    parser.add_argument('--formats', nargs='+', choices=list(EXPORTS), help='export formats to run')
+    parser.add_argument('--no-restore', action='store_true', help='only benchmark exports')
+    parser.add_argument('--workdir', help='directory for fixtures and backups')
+    parser.add_argument('--reuse', action='store_true', help='reuse a previously generated fixture')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report to this JSON file')
+    parser.add_argument('--baseline', help='compare against a previous JSON report')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+    
+    report = run_benchmarks(args.scale, args.formats, not args.no_restore, args.workdir, args.reuse, args.seed)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']} {regression['metric']}: "
+                  f"{regression['baseline']:.3g} -> {regression['value']:.3g} ({regression['change']:+.0%})")
+        
+        if regressions:
+            sys.exit(1)
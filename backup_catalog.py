@@ -0,0 +1,189 @@
+import os
+import json
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime
+from config import Config
+
+class BackupCatalog:
+    """Persistent index of the backups in a backup directory
+    
+    Every backup written by ``BackupManager`` is recorded here with its
+    format, size, SHA-256 checksum, per-table row counts and row digests,
+    duration, base/delta lineage and, for partial backups, the tables and
+    row filter they were taken with, so listing and retention are indexed
+    queries rather than directory scans.
+    """
+    
+    COLUMNS = (
+        'filename', 'format', 'type', 'size', 'checksum', 'created_at',
+        'duration', 'tables', 'parent', 'watermarks', 'digests', 'selection'
+    )
+    JSON_COLUMNS = ('tables', 'watermarks', 'digests', 'selection')
+    
+    def __init__(self, backup_dir):
+        self.backup_dir = backup_dir
+        self.path = os.path.join(backup_dir, Config.BACKUP_CATALOG_FILE)
+        
+        is_new = not os.path.exists(self.path)
+        
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS backups (
+                    filename TEXT PRIMARY KEY,
+                    format TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    size INTEGER,
+                    checksum TEXT,
+                    created_at TEXT NOT NULL,
+                    duration REAL,
+                    tables TEXT,
+                    parent TEXT,
+                    watermarks TEXT,
+                    digests TEXT,
+                    selection TEXT
+                )
+            """)
+            
+            # Catalogs created before a column was added
+            existing = {row['name'] for row in conn.execute("PRAGMA table_info(backups)")}
+            for column in self.COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE backups ADD COLUMN {column} TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_backups_created_at ON backups (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_backups_parent ON backups (parent)")
+        
+        # Pick up backups written before the catalog existed
+        if is_new:
+            self.rebuild()
+    
+    @contextmanager
+    def _connect(self):
+        """Open the catalog, committing on success and always closing"""
+        
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def _to_entry(self, row):
+        """Convert a catalog row to an entry dict"""
+        
+        entry = dict(row)
+        for column in self.JSON_COLUMNS:
+            if entry[column] is not None:
+                entry[column] = json.loads(entry[column])
+        return entry
+    
+    def add(self, entry):
+        """Record a backup, replacing any previous entry with the same filename"""
+        
+        values = dict.fromkeys(self.COLUMNS)
+        values.update(entry)
+        for column in self.JSON_COLUMNS:
+            if values[column] is not None:
+                values[column] = json.dumps(values[column], ensure_ascii=False)
+        
+        columns_str = ', '.join(self.COLUMNS)
+        placeholders = ', '.join(['?' for _ in self.COLUMNS])
+        
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO backups ({columns_str}) VALUES ({placeholders})",
+                [values[column] for column in self.COLUMNS]
+            )
+        
+        return entry
+    
+    def get(self, filename):
+        """Return the entry for a backup file, or None"""
+        
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM backups WHERE filename = ?", (filename,)).fetchone()
+        
+        return self._to_entry(row) if row else None
+    
+    def entries(self, before=None):
+        """Return catalog entries newest first, optionally only those created before ``before``"""
+        
+        query = "SELECT * FROM backups"
+        params = ()
+        if before is not None:
+            query += " WHERE created_at < ?"
+            params = (before.isoformat(),)
+        query += " ORDER BY created_at DESC"
+        
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        
+        return [self._to_entry(row) for row in rows]
+    
+    def latest_incremental(self):
+        """Return the newest backup that carries incremental watermarks"""
+        
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM backups WHERE watermarks IS NOT NULL "
+                "ORDER BY created_at DESC, rowid DESC LIMIT 1"
+            ).fetchone()
+        
+        return self._to_entry(row) if row else None
+    
+    def remove(self, filename):
+        """Forget a backup"""
+        
+        with self._connect() as conn:
+            conn.execute("DELETE FROM backups WHERE filename = ?", (filename,))
+    
+    def rebuild(self):
+        """Add untracked backup files in the directory to the catalog
+        
+        This is the only operation that scans the backup directory. Row
+        counts and lineage are unknown for such files.
+        """
+        
+        known = {entry['filename'] for entry in self.entries()}
+        added = 0
+        
+        for filename in os.listdir(self.backup_dir):
+            filepath = os.path.join(self.backup_dir, filename)
+            
+            if filename in known or not filename.startswith('qat_backup_') or not os.path.isfile(filepath):
+                continue
+            
+            stat = os.stat(filepath)
+            backup_format = backup_format_of(filename)
+            
+            self.add({
+                'filename': filename,
+                'format': backup_format,
+                'type': 'delta' if backup_format.startswith('delta.') else 'full',
+                'size': stat.st_size,
+                'checksum': file_checksum(filepath),
+                'created_at': datetime.fromtimestamp(stat.st_mtime).isoformat()
+            })
+            added += 1
+        
+        return added
+
+
+def backup_format_of(filename):
+    """Return the format part of a backup filename, e.g. ``ndjson.gz`` or ``db``"""
+    
+    return filename.split('.', 1)[1] if '.' in filename else ''
+
+
+def file_checksum(path):
+    """Return the SHA-256 hex digest of a file"""
+    
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
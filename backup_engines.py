@@ -0,0 +1,255 @@
+import io
+import os
+import csv
+import time
+import sqlite3
+import zipfile
+import importlib
+from config import Config
+from backup_pipeline import strip_compression
+
+# Registered engines by name: an engine instance, class, or 'module:attribute' path
+ENGINES = {}
+# Engine name for each backup file extension
+EXTENSIONS = {}
+# How NULL is written in CSV backups, as in PostgreSQL's COPY
+CSV_NULL = '\\N'
+# Prefix of hex-encoded BLOBs in CSV backups
+CSV_BLOB_PREFIX = '\\x'
+
+class BackupEngine:
+    """Base class of a backup format
+    
+    An engine exports a database through a ``BackupManager`` and restores a
+    backup file through a ``BulkLoader``. ``extensions`` are the file
+    extensions (before any compression extension) it restores.
+    ``incremental`` engines restore a backup by replaying its whole
+    base/delta chain, and ``streams_checksum`` engines verify the catalog
+    checksum themselves while reading.
+    """
+    
+    name = None
+    extensions = ()
+    incremental = False
+    streams_checksum = False
+    
+    def export(self, manager, **options):
+        """Write a backup and return its path"""
+        
+        raise NotImplementedError
+    
+    def restore(self, manager, path, loader):
+        """Load the rows of one backup file into ``loader``"""
+        
+        raise NotImplementedError
+
+
+class JsonEngine(BackupEngine):
+    name = 'json'
+    extensions = ('.json',)
+    streams_checksum = True
+    
+    def export(self, manager, **options):
+        return manager.export_to_json(**options)
+    
+    def restore(self, manager, path, loader):
+        manager._restore_from_json(path, loader)
+
+
+class NdjsonEngine(JsonEngine):
+    name = 'ndjson'
+    extensions = ('.ndjson',)
+    
+    def export(self, manager, **options):
+        return manager.export_to_json(ndjson=True, **options)
+
+
+class IncrementalEngine(BackupEngine):
+    name = 'incremental'
+    extensions = ('.delta.ndjson',)
+    incremental = True
+    streams_checksum = True
+    
+    def export(self, manager, **options):
+        return manager.export_incremental(**options)
+    
+    def restore(self, manager, path, loader):
+        # Later rows in the chain replace earlier versions
+        manager._restore_from_ndjson(path, loader, replace=True)
+
+
+class ExcelEngine(BackupEngine):
+    name = 'xlsx'
+    extensions = ('.xlsx',)
+    
+    def export(self, manager, **options):
+        return manager.export_to_excel(**options)
+    
+    def restore(self, manager, path, loader):
+        manager._restore_from_excel(path, loader)
+
+
+class SnapshotEngine(BackupEngine):
+    name = 'sqlite-snapshot'
+    extensions = ('.db',)
+    
+    def export(self, manager, **options):
+        return manager.export_snapshot(**options)
+    
+    def restore(self, manager, path, loader):
+        manager._restore_from_snapshot(path, loader)
+
+
+class ChunkEngine(BackupEngine):
+    name = 'cas'
+    extensions = ('.cas.json',)
+    
+    def export(self, manager, **options):
+        return manager.export_deduplicated(**options)
+    
+    def restore(self, manager, path, loader):
+        manager._restore_from_chunks(path, loader)
+
+
+class CsvEngine(BackupEngine):
+    """ZIP archive with one CSV file per table
+    
+    NULL is written as ``\\N`` and BLOBs as ``\\x`` followed by hex, and
+    text starting with a backslash gets a second one, so all three survive
+    the round trip. Other values are restored as text and converted back by
+    the column affinity of the restored table.
+    """
+    
+    name = 'csv'
+    extensions = ('.csv.zip',)
+    
+    def export(self, manager, chunk_size=None, tables=None, where=None):
+        # backup_manager imports this module
+        from backup_manager import _new_selection
+        
+        chunk_size = chunk_size or Config.BACKUP_CHUNK_SIZE
+        selection = _new_selection(tables, where)
+        started = time.perf_counter()
+        
+        # Generate filename
+        filename, filepath = manager._new_backup_path('.csv.zip')
+        
+        conn = sqlite3.connect(manager.db_path)
+        row_counts = {}
+        
+        try:
+            # Read all tables from the same snapshot
+            conn.execute('BEGIN')
+            
+            with zipfile.ZipFile(filepath, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for table_name, (clause, params) in manager._select_tables(conn, selection).items():
+                    timer = manager._timer(filename, table_name)
+                    columns, chunks = manager._read_table_chunks(
+                        conn, table_name, chunk_size, f"SELECT * FROM {table_name}{clause}", params
+                    )
+                    row_counts[table_name] = 0
+                    
+                    with archive.open(f'{table_name}.csv', 'w') as member:
+                        f = io.TextIOWrapper(member, encoding='utf-8', newline='')
+                        writer = csv.writer(f)
+                        writer.writerow(columns)
+                        
+                        for rows in chunks:
+                            timer.lap('read', len(rows))
+                            writer.writerows([_to_csv_value(value) for value in row] for row in rows)
+                            timer.lap('write', len(rows))
+                            row_counts[table_name] += len(rows)
+                        
+                        f.flush()
+                        f.detach()
+                    timer.finish()
+        finally:
+            conn.rollback()
+            conn.close()
+        
+        manager._record_backup(filename, started, row_counts, selection=selection)
+        
+        return filepath
+    
+    def restore(self, manager, path, loader):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if not member.endswith('.csv'):
+                    continue
+                
+                with archive.open(member) as raw:
+                    reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8', newline=''))
+                    columns = next(reader, None)
+                    if columns:
+                        rows = ([_from_csv_value(value) for value in row] for row in reader)
+                        loader.load(member[:-len('.csv')], columns, rows)
+
+
+def register_engine(engine, name=None, extensions=None):
+    """Make a backup format available by name and file extension
+    
+    ``engine`` is an engine instance or class, or a ``'module:attribute'``
+    path that is only imported the first time the engine is used, in which
+    case ``name`` and ``extensions`` must be given.
+    """
+    
+    name = name or engine.name
+    extensions = extensions or engine.extensions
+    if not name or not extensions:
+        raise ValueError("A backup engine needs a name and file extensions")
+    
+    ENGINES[name] = engine
+    for extension in extensions:
+        EXTENSIONS[extension] = name
+
+
+def get_engine(name):
+    """Return the engine registered under ``name``, loading it on first use"""
+    
+    engine = ENGINES.get(name)
+    if engine is None:
+        raise ValueError(f"Unknown backup engine: {name}")
+    
+    if isinstance(engine, str):
+        module_name, attribute = engine.split(':', 1)
+        engine = getattr(importlib.import_module(module_name), attribute)
+    if isinstance(engine, type):
+        engine = engine()
+    
+    ENGINES[name] = engine
+    return engine
+
+
+def engine_for_path(path):
+    """Return the engine that restores a backup file, matching the longest extension"""
+    
+    base = strip_compression(os.path.basename(path))
+    matches = [extension for extension in EXTENSIONS if base.endswith(extension)]
+    if not matches:
+        raise ValueError("Unsupported backup file format")
+    
+    return get_engine(EXTENSIONS[max(matches, key=len)])
+
+
+def _to_csv_value(value):
+    if value is None:
+        return CSV_NULL
+    if isinstance(value, bytes):
+        return CSV_BLOB_PREFIX + value.hex()
+    if isinstance(value, str) and value.startswith('\\'):
+        return '\\' + value
+    return value
+
+
+def _from_csv_value(value):
+    if value == CSV_NULL:
+        return None
+    if value.startswith('\\\\'):
+        return value[1:]
+    if value.startswith(CSV_BLOB_PREFIX):
+        return bytes.fromhex(value[len(CSV_BLOB_PREFIX):])
+    return value
+
+
+for _engine in (JsonEngine, NdjsonEngine, IncrementalEngine, ExcelEngine, SnapshotEngine, ChunkEngine, CsvEngine):
+    register_engine(_engine)
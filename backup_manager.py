@@ -1,9 +1,45 @@
+import io
 import os
 import json
+import math
+import hashlib
 import sqlite3
-from datetime import datetime, timedelta
-import pandas as pd
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from config import Config
+from backup_catalog import BackupCatalog, backup_format_of, file_checksum
+from backup_store import ChunkStore
+from backup_metrics import NULL_TIMER, PhaseTimer
+from backup_engines import engine_for_path, get_engine
+from backup_pipeline import (
+    COMPRESSION, HashingReader, PipelineWriter, RowsDigest,
+    compress_bytes, compression_of, strip_compression
+)
+
+# Rows per worksheet, including the header row
+EXCEL_MAX_ROWS = 1048576
+# Hidden sheet mapping worksheet names back to table names
+EXCEL_INDEX_SHEET = '_tables'
+# Matches how SQLAlchemy stores DateTime columns in SQLite
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+# Period a backup falls into for each grandfather-father-son retention tier
+RETENTION_TIERS = {
+    'hourly': lambda created_at: (created_at.date(), created_at.hour),
+    'daily': lambda created_at: created_at.date(),
+    'weekly': lambda created_at: created_at.isocalendar()[:2],
+    'monthly': lambda created_at: (created_at.year, created_at.month)
+}
+# SQL of the comparison operators accepted in row filters
+FILTER_OPERATORS = {
+    '=': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>=',
+    'like': 'LIKE', 'in': 'IN', 'not in': 'NOT IN'
+}
+
+class BackupCancelled(Exception):
+    """Raised inside a backup or restore once its ``cancel_event`` is set"""
+
 
 class BackupManager:
     def __init__(self, db_path='qat_app.db'):
@@ -11,211 +47,2019 @@ class BackupManager:
         self.backup_dir = Config.BACKUP_DIR
         
         # Create backup directory if not exists
-        if not os.path.exists(self.backup_dir):
-            os.makedirs(self.backup_dir)
+        os.makedirs(self.backup_dir, exist_ok=True)
+        
+        self.catalog = BackupCatalog(self.backup_dir)
+        self.chunk_store = ChunkStore(os.path.join(self.backup_dir, Config.BACKUP_CHUNK_STORE_DIR))
+        
+        # Optional IOThrottle pacing backup writes, set by BackupScheduler
+        self.throttle = None
+        # Callables receiving instrumentation events, see add_observer
+        self.observers = []
+        # Optional callable receiving a dict after every chunk, and an event that cancels the operation
+        self.progress = None
+        self.cancel_event = None
+        # Backup files being written, removed by _discard_partial_backups if the backup fails
+        self._partial_paths = set()
+    
+    def add_observer(self, observer):
+        """Register a callable that receives an event dict for each backup phase
+        
+        Events have ``phase`` (``read``, ``serialize``, ``write``,
+        ``compress``, ``disk_write``, ``restore_insert``, and ``backup`` or
+        ``restore`` for a whole operation), ``backup``, ``table``, ``rows``,
+        ``bytes``, ``seconds`` and ``started`` (a Unix timestamp). Phases of
+        a table are summed over the table. With no observers attached, no
+        measurements are taken.
+        """
+        
+        self.observers.append(observer)
+        return observer
+    
+    def remove_observer(self, observer):
+        """Stop sending events to an observer"""
+        
+        self.observers.remove(observer)
     
-    def export_to_excel(self):
-        """Export entire database to Excel file"""
+    def export(self, engine, **options):
+        """Take a backup with a registered engine, e.g. ``'ndjson'`` or ``'csv'``
+        
+        See ``backup_engines`` for the available engines and how to add one.
+        """
+        
+        return get_engine(engine).export(self, **options)
+    
+    def export_to_excel(self, chunk_size=None, tables=None, where=None):
+        """Export entire database to Excel file
+        
+        Tables are read in ``chunk_size`` batches and appended through
+        openpyxl's write-only mode, which streams cells to disk instead of
+        keeping them in memory. Tables longer than one worksheet continue on
+        ``<table>_2``, ``<table>_3``, ...; a hidden ``_tables`` sheet maps
+        every worksheet back to its table. ``tables`` and ``where`` export
+        only part of the database, see ``export_to_json``.
+        """
+        
+        # Heavy, so only imported when an Excel backup is taken
+        from openpyxl import Workbook
+        
+        chunk_size = chunk_size or Config.BACKUP_CHUNK_SIZE
+        selection = _new_selection(tables, where)
+        started = time.perf_counter()
         
         # Generate filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'qat_backup_{timestamp}.xlsx'
-        filepath = os.path.join(self.backup_dir, filename)
+        filename, filepath = self._new_backup_path('.xlsx')
         
         # Connect to database
         conn = sqlite3.connect(self.db_path)
+        workbook = Workbook(write_only=True)
+        sheet_tables = []
+        row_counts = {}
         
-        # Get all tables
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
+        def add_sheet(table_name, columns):
+            part = sum(1 for _, table in sheet_tables if table == table_name) + 1
+            suffix = f'_{part}' if part > 1 else ''
+            sheet_name = table_name[:31 - len(suffix)] + suffix
+            
+            # Truncated names can clash
+            taken = {name for name, _ in sheet_tables}
+            counter = 1
+            while sheet_name in taken:
+                suffix = f'~{counter}'
+                sheet_name = table_name[:31 - len(suffix)] + suffix
+                counter += 1
+            
+            sheet_tables.append((sheet_name, table_name))
+            worksheet = workbook.create_sheet(sheet_name)
+            worksheet.append(columns)
+            return worksheet
         
-        # Create Excel writer
-        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-            for table_name in tables:
-                table_name = table_name[0]
+        try:
+            for table_name, (clause, params) in self._select_tables(conn, selection).items():
+                timer = self._timer(filename, table_name)
+                columns, chunks = self._read_table_chunks(
+                    conn, table_name, chunk_size, f"SELECT * FROM {table_name}{clause}", params
+                )
+                worksheet = add_sheet(table_name, columns)
+                row_counts[table_name] = 0
+                sheet_rows = 1
                 
-                # Skip sqlite_sequence table
-                if table_name == 'sqlite_sequence':
-                    continue
+                for rows in chunks:
+                    timer.lap('read', len(rows))
+                    for row in rows:
+                        if sheet_rows >= EXCEL_MAX_ROWS:
+                            worksheet = add_sheet(table_name, columns)
+                            sheet_rows = 1
+                        
+                        worksheet.append(row)
+                        sheet_rows += 1
+                    
+                    timer.lap('write', len(rows))
+                    row_counts[table_name] += len(rows)
+                timer.finish()
+            
+            index = workbook.create_sheet(EXCEL_INDEX_SHEET)
+            index.sheet_state = 'hidden'
+            index.append(['sheet', 'table'])
+            for sheet_name, table_name in sheet_tables:
+                index.append([sheet_name, table_name])
+            
+            workbook.save(filepath)
+        except BaseException:
+            # Write-only sheets stream to temp files that only save() closes
+            _discard_workbook(workbook)
+            raise
+        finally:
+            conn.close()
+        
+        self._record_backup(filename, started, row_counts, selection=selection)
+        
+        return filepath
+    
+    def export_to_json(self, ndjson=False, compress=False, chunk_size=None, tables=None, where=None):
+        """Export entire database to JSON file
+        
+        Rows are read with ``fetchmany`` in batches of ``chunk_size`` and
+        written straight to the file, so memory stays bounded regardless of
+        table size. With ``ndjson`` every table is written as a section
+        header line followed by one line per row. ``compress`` selects
+        ``'gzip'`` (or ``True``), ``'lzma'`` or ``'bz2'``; compression and
+        checksumming run in pipeline threads alongside serialization.
+        
+        ``tables`` and ``where`` take a partial backup. ``where`` maps
+        columns to a value, a list of values, or ``{operator: value}`` with
+        the operators of ``FILTER_OPERATORS``, for example
+        ``{'createdAt': {'>=': '2026-03-01', '<': '2026-04-01'}}`` or
+        ``{'marketId': 4}``. The filter runs in SQLite as the rows are read;
+        without ``tables`` it covers every table that has all the filtered
+        columns. The selection is kept in the catalog, so restoring the
+        backup only replaces the rows it holds.
+        """
+        
+        chunk_size = chunk_size or Config.BACKUP_CHUNK_SIZE
+        codec = self._compression_codec(compress)
+        selection = _new_selection(tables, where)
+        started = time.perf_counter()
+        
+        # Generate filename
+        extension = '.ndjson' if ndjson else '.json'
+        if codec:
+            extension += COMPRESSION[codec][0]
+        filename, filepath = self._new_backup_path(extension)
+        
+        # Connect to database
+        conn = sqlite3.connect(self.db_path)
+        
+        try:
+            selected = self._select_tables(conn, selection)
+            
+            with self._open_backup_file(filepath) as f:
+                if ndjson:
+                    row_counts, digests = self._write_ndjson(conn, f, chunk_size, selected)
+                else:
+                    row_counts, digests = self._write_json(conn, f, chunk_size, selected)
+        finally:
+            conn.close()
+        
+        self._emit_pipeline(f)
+        self._record_backup(
+            filename, started, row_counts, checksum=f.checksum, digests=digests, selection=selection
+        )
+        
+        return filepath
+    
+    def export_parallel(self, workers=None, processes=False, compress=False, chunk_size=None):
+        """Export entire database to NDJSON using a pool of workers
+        
+        Tables, and rowid ranges of tables larger than
+        ``Config.BACKUP_PARALLEL_SPLIT_ROWS``, are exported concurrently by
+        ``workers`` threads (or processes with ``processes``), each with its
+        own read-only connection. The database is switched to WAL mode so
+        those readers never block writers. Every worker writes a part file
+        (its own compressed stream with ``compress``) and the parts are
+        concatenated in table and rowid order into one file that
+        ``_restore_from_json`` reads like any NDJSON backup. Each part sees
+        its own snapshot, so the export is not a single point in time.
+        """
+        
+        workers = workers or Config.BACKUP_WORKERS or os.cpu_count()
+        chunk_size = chunk_size or Config.BACKUP_CHUNK_SIZE
+        codec = self._compression_codec(compress)
+        started = time.perf_counter()
+        
+        # Generate filename
+        extension = '.ndjson' + (COMPRESSION[codec][0] if codec else '')
+        filename, filepath = self._new_backup_path(extension)
+        
+        conn = sqlite3.connect(self.db_path)
+        
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            
+            # Split work into (table, first rowid, last rowid + 1) ranges
+            tables = []
+            for table_name in self._get_tables(conn):
+                cursor = conn.execute(f"SELECT MIN(rowid), MAX(rowid), COUNT(*) FROM {table_name}")
+                low, high, count = cursor.fetchone()
                 
-                # Read table to DataFrame
-                df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+                ranges = []
+                if count:
+                    parts = math.ceil(count / Config.BACKUP_PARALLEL_SPLIT_ROWS)
+                    step = math.ceil((high - low + 1) / parts)
+                    ranges = [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
                 
-                # Write to Excel sheet
-                df.to_excel(writer, sheet_name=table_name[:31], index=False)
+                tables.append((table_name, self._get_columns(conn, table_name), ranges))
+        finally:
+            conn.close()
         
-        conn.close()
+        part_paths = []
+        executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        
+        try:
+            with executor_class(max_workers=workers) as executor:
+                futures = []
+                for table_name, _, ranges in tables:
+                    for start, end in ranges:
+                        part_path = os.path.join(self.backup_dir, f'.{filename}.{len(part_paths)}.part')
+                        part_paths.append(part_path)
+                        futures.append((table_name, executor.submit(
+                            _export_rowid_range, self.db_path, table_name,
+                            start, end, part_path, codec, chunk_size,
+                            # A throttle cannot be shared with worker processes
+                            None if processes else self.throttle
+                        )))
+                
+                row_counts = {table_name: 0 for table_name, _, _ in tables}
+                digests = {table_name: RowsDigest() for table_name, _, _ in tables}
+                for table_name, future in futures:
+                    count, digest = future.result()
+                    row_counts[table_name] += count
+                    digests[table_name].combine(digest)
+            
+            # Merge headers and parts in order, hashing as we go
+            digest = hashlib.sha256()
+            
+            def write(f, data):
+                self._throttle(len(data))
+                digest.update(data)
+                f.write(data)
+            
+            def encode(record):
+                return compress_bytes((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'), codec)
+            
+            parts = iter(part_paths)
+            with open(filepath, 'wb') as f:
+                write(f, encode({'export_date': datetime.now().isoformat(), 'format': 'ndjson'}))
+                
+                for table_name, columns, ranges in tables:
+                    write(f, encode({'table': table_name, 'columns': columns}))
+                    
+                    for _ in ranges:
+                        with open(next(parts), 'rb') as part:
+                            for block in iter(lambda: part.read(1024 * 1024), b''):
+                                write(f, block)
+        finally:
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+        
+        self._record_backup(
+            filename, started, row_counts,
+            checksum=digest.hexdigest(),
+            digests={table_name: digest.hexdigest() for table_name, digest in digests.items()}
+        )
         
         return filepath
     
-    def export_to_json(self):
-        """Export entire database to JSON file"""
+    def export_deduplicated(self, chunk_rows=None, chunk_size=None):
+        """Write a deduplicated backup to the content-addressed chunk store
+        
+        Each table is cut into chunks of ``chunk_rows`` consecutive rowids,
+        every chunk is stored once in the chunk store under its hash, and the
+        backup itself is a small ``.cas.json`` manifest of chunk digests.
+        Chunks whose rows did not change are shared with earlier backups, so
+        unchanged tables cost neither disk space nor writes.
+        """
+        
+        chunk_rows = chunk_rows or Config.BACKUP_CAS_CHUNK_ROWS
+        chunk_size = chunk_size or Config.BACKUP_CHUNK_SIZE
+        started = time.perf_counter()
         
         # Generate filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'qat_backup_{timestamp}.json'
-        filepath = os.path.join(self.backup_dir, filename)
+        filename, filepath = self._new_backup_path('.cas.json')
+        
+        conn = sqlite3.connect(self.db_path)
+        manifest = {'export_date': datetime.now().isoformat(), 'format': 'cas', 'tables': []}
+        row_counts = {}
+        
+        try:
+            # Read all tables from the same snapshot
+            conn.execute('BEGIN')
+            
+            for table_name in self._get_tables(conn):
+                timer = self._timer(filename, table_name)
+                query = f"SELECT rowid, * FROM {table_name} ORDER BY rowid"
+                _, chunks = self._read_table_chunks(conn, table_name, chunk_size, query)
+                digests = []
+                lines = []
+                bucket = None
+                row_counts[table_name] = 0
+                
+                for rows in chunks:
+                    timer.lap('read', len(rows))
+                    for row in rows:
+                        # Chunk boundaries follow rowids so they stay stable between backups
+                        if row[0] // chunk_rows != bucket and lines:
+                            data = ''.join(lines).encode('utf-8')
+                            timer.lap('serialize', data=data)
+                            digests.append(self._put_chunk(data))
+                            timer.lap('write', data=data)
+                            lines = []
+                        bucket = row[0] // chunk_rows
+                        lines.append(_encode_row(row) + '\n')
+                    row_counts[table_name] += len(rows)
+                
+                if lines:
+                    data = ''.join(lines).encode('utf-8')
+                    timer.lap('serialize', data=data)
+                    digests.append(self._put_chunk(data))
+                    timer.lap('write', data=data)
+                timer.finish()
+                
+                manifest['tables'].append({
+                    'table': table_name,
+                    'columns': ['rowid'] + self._get_columns(conn, table_name),
+                    'chunks': digests
+                })
+        finally:
+            conn.rollback()
+            conn.close()
+        
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        
+        self._record_backup(filename, started, row_counts)
+        
+        return filepath
+    
+    def _put_chunk(self, data):
+        """Store a chunk in the chunk store within the I/O budget"""
+        
+        self._throttle(len(data))
+        return self.chunk_store.put(data)
+    
+    def collect_chunks(self):
+        """Delete chunks no deduplicated backup in the catalog refers to"""
+        
+        referenced = set()
+        for entry in self.catalog.entries():
+            if entry['format'] != 'cas.json':
+                continue
+            
+            with open(os.path.join(self.backup_dir, entry['filename']), 'r', encoding='utf-8') as f:
+                for table in json.load(f)['tables']:
+                    referenced.update(table['chunks'])
+        
+        return self.chunk_store.sweep(referenced, Config.BACKUP_CHUNK_GC_GRACE)
+    
+    def export_snapshot(self, pages=None, sleep=None, progress=None):
+        """Take an online snapshot of the database with the SQLite backup API
+        
+        Pages are copied ``pages`` at a time with a ``sleep`` pause between
+        steps, so the shared lock on the live database is only held briefly
+        and writers are not stalled. ``progress`` is called as
+        ``progress(copied_pages, total_pages)`` after every step.
+        """
+        
+        pages = pages or Config.BACKUP_SNAPSHOT_PAGES
+        sleep = Config.BACKUP_SNAPSHOT_SLEEP if sleep is None else sleep
+        started = time.perf_counter()
+        
+        # Generate filename
+        filename, filepath = self._new_backup_path('.db')
+        
+        # Copy into a hidden file first so list_backups never sees a partial snapshot;
+        # it is named after the reserved filename, so every job has its own
+        temp_path = os.path.join(self.backup_dir, f'.{filename}.tmp')
+        
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(temp_path)
+        page_size = source.execute("PRAGMA page_size").fetchone()[0]
+        
+        def on_step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            self._checkpoint(pages=total - remaining, total_pages=total)
+            self._throttle(pages * page_size)
+            if remaining and sleep:
+                time.sleep(sleep)
+        
+        try:
+            source.backup(target, pages=pages, progress=on_step)
+        finally:
+            target.close()
+            source.close()
+        
+        # Count rows in the copy, not the live database
+        snapshot = sqlite3.connect(temp_path)
+        try:
+            row_counts = {
+                table_name: snapshot.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                for table_name in self._get_tables(snapshot)
+            }
+        finally:
+            snapshot.close()
+        
+        os.replace(temp_path, filepath)
+        self._record_backup(filename, started, row_counts)
+        
+        return filepath
+    
+    def export_incremental(self, full=False, chunk_size=None):
+        """Write an incremental backup with only the rows changed since the last one
+        
+        The backup catalog records a per-table watermark: the highest rowid,
+        plus the highest ``updatedAt`` for tables that have one. The first
+        backup, or one taken with ``full``, is a full NDJSON export that
+        starts a new chain; later ones are delta files holding only rows past
+        the previous watermarks. Rows whose marker equals the previous one
+        are exported again, since they may have changed within the same
+        tick; restoring replaces them, so repeats are harmless. Tables
+        without a ``Config.BACKUP_UPDATE_COLUMNS`` column cannot show which
+        rows were updated and are copied whole into every delta. A chain
+        that already has ``Config.BACKUP_INCREMENTAL_MAX_CHAIN`` deltas is
+        ended with a new full export, so retention can prune it and restores
+        replay a bounded number of files. Deleted rows are not tracked, so
+        take a full backup after bulk deletes.
+        """
+        
+        chunk_size = chunk_size or Config.BACKUP_CHUNK_SIZE
+        started = time.perf_counter()
+        parent = None if full else self.catalog.latest_incremental()
+        if parent and self._chain_length(parent) >= Config.BACKUP_INCREMENTAL_MAX_CHAIN:
+            parent = None
+        
+        # Generate filename
+        extension = '.delta.ndjson' if parent else '.ndjson'
+        filename, filepath = self._new_backup_path(extension)
         
-        # Connect to database
         conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        watermarks = {}
+        row_counts = {}
+        digests = {}
+        
+        try:
+            # Read watermarks and rows from the same snapshot
+            conn.execute('BEGIN')
+            
+            with self._open_backup_file(filepath) as f:
+                header = {'export_date': datetime.now().isoformat(), 'format': 'ndjson'}
+                if parent:
+                    header.update({'type': 'delta', 'parent': parent['filename']})
+                f.write(json.dumps(header) + '\n')
+                
+                for table_name in self._get_tables(conn):
+                    columns = self._get_columns(conn, table_name)
+                    marker = next((c for c in Config.BACKUP_UPDATE_COLUMNS if c in columns), None)
+                    watermarks[table_name] = self._get_watermark(conn, table_name, marker)
+                    
+                    query = f"SELECT rowid, * FROM {table_name}"
+                    params = ()
+                    previous = parent['watermarks'].get(table_name) if parent else None
+                    # Without an update marker only a full copy catches updated rows
+                    if previous and marker:
+                        query += " WHERE rowid > ?"
+                        params = (previous['rowid'],)
+                        if previous['marker'] is not None:
+                            query += f" OR {marker} >= ?"
+                            params += (previous['marker'],)
+                        else:
+                            query += f" OR {marker} IS NOT NULL"
+                    
+                    header = {'table': table_name, 'columns': ['rowid'] + columns}
+                    f.write(json.dumps(header, ensure_ascii=False) + '\n')
+                    
+                    timer = self._timer(filename, table_name)
+                    _, chunks = self._read_table_chunks(conn, table_name, chunk_size, query, params)
+                    row_counts[table_name] = 0
+                    digest = RowsDigest()
+                    for rows in chunks:
+                        timer.lap('read', len(rows))
+                        lines = [_encode_row(row) for row in rows]
+                        digest.update(lines)
+                        text = '\n'.join(lines) + '\n'
+                        timer.lap('serialize', len(rows), text)
+                        f.write(text)
+                        timer.lap('write', len(rows), text)
+                        row_counts[table_name] += len(rows)
+                    digests[table_name] = digest.hexdigest()
+                    timer.finish()
+        finally:
+            conn.rollback()
+            conn.close()
+        
+        self._emit_pipeline(f)
+        self._record_backup(
+            filename, started, row_counts,
+            parent=parent['filename'] if parent else None,
+            watermarks=watermarks,
+            checksum=f.checksum,
+            digests=digests
+        )
+        
+        return filepath
+    
+    def _get_columns(self, conn, table_name):
+        """Return the column names of a table"""
+        
+        cursor = conn.cursor()
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        return [row[1] for row in cursor.fetchall()]
+    
+    def _get_watermark(self, conn, table_name, marker):
+        """Return the highest rowid and update marker of a table"""
+        
+        cursor = conn.cursor()
+        if marker:
+            cursor.execute(f"SELECT MAX(rowid), MAX({marker}) FROM {table_name}")
+        else:
+            cursor.execute(f"SELECT MAX(rowid), NULL FROM {table_name}")
+        max_rowid, max_marker = cursor.fetchone()
+        
+        return {'rowid': max_rowid or 0, 'marker': max_marker}
+    
+    def _record_backup(self, filename, started, row_counts, parent=None, watermarks=None,
+                       checksum=None, digests=None, selection=None):
+        """Add a finished backup to the catalog
+        
+        Pass ``checksum`` when it was computed while writing; otherwise the
+        file is read again to hash it. ``digests`` maps tables to the
+        ``RowsDigest`` of their serialized rows, used by ``verify_backup``.
+        ``selection`` marks a partial backup, see ``_new_selection``.
+        """
+        
+        filepath = os.path.join(self.backup_dir, filename)
+        duration = time.perf_counter() - started
+        self._partial_paths.discard(filepath)
+        
+        entry = self.catalog.add({
+            'filename': filename,
+            'format': backup_format_of(filename),
+            'type': 'delta' if parent else ('partial' if selection else 'full'),
+            'size': os.path.getsize(filepath),
+            'checksum': checksum or file_checksum(filepath),
+            'created_at': datetime.now().isoformat(),
+            'duration': duration,
+            'tables': row_counts,
+            'parent': parent,
+            'watermarks': watermarks,
+            'digests': digests,
+            'selection': selection
+        })
+        
+        if self.observers:
+            self._emit(
+                'backup', filename, rows=sum(row_counts.values()), nbytes=entry['size'],
+                seconds=duration, started=time.time() - duration, format=entry['format']
+            )
+        
+        return entry
+    
+    def _get_restore_chain(self, backup_path):
+        """Return the full base and ordered deltas needed to restore a delta backup"""
+        
+        filename = os.path.basename(backup_path)
+        chain = []
+        
+        while filename:
+            entry = self.catalog.get(filename)
+            if entry is None:
+                raise ValueError(f"Backup {filename} is not in the backup catalog")
+            chain.append(os.path.join(os.path.dirname(backup_path), filename))
+            filename = entry['parent']
+        
+        chain.reverse()
+        return chain
+    
+    def _new_backup_path(self, extension):
+        """Reserve a timestamped backup filename and return it with its path
+        
+        The name is claimed by creating an empty file, so concurrent jobs in
+        this or another process never write to the same file.
+        """
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f'qat_backup_{timestamp}{extension}'
+        counter = 1
+        
+        # Several backups can be taken within the same second
+        while True:
+            filepath = os.path.join(self.backup_dir, filename)
+            try:
+                os.close(os.open(filepath, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                filename = f'qat_backup_{timestamp}_{counter}{extension}'
+                counter += 1
+        
+        self._partial_paths.add(filepath)
+        return filename, filepath
+    
+    def _get_tables(self, conn):
+        """Return the names of all user tables"""
         
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
         
-        data = {
-            'export_date': datetime.now().isoformat(),
-            'tables': {}
-        }
+        # Skip sqlite_sequence table
+        return [row[0] for row in cursor.fetchall() if row[0] != 'sqlite_sequence']
+    
+    def _select_tables(self, conn, *selections):
+        """Return ``{table: (where_clause, params)}`` for the tables in every selection
         
-        for table_name in tables:
-            table_name = table_name[0]
+        Selections come from ``_new_selection`` and None selects everything.
+        Tables without all the filtered columns are left out, unless a
+        selection names them, which is an error, as are naming a table that
+        does not exist and filters that no table has the columns for.
+        """
+        
+        available = self._get_tables(conn)
+        selections = [selection for selection in selections if selection]
+        wheres = [selection['where'] for selection in selections]
+        filtered = {column for where in wheres for column in where}
+        named = set()
+        
+        for selection in selections:
+            if selection['tables'] is not None:
+                unknown = sorted(set(selection['tables']) - set(available))
+                if unknown:
+                    raise ValueError(f"Unknown tables: {', '.join(unknown)}")
+                named.update(selection['tables'])
+        
+        selected = {}
+        for table_name in available:
+            if any(s['tables'] is not None and table_name not in s['tables'] for s in selections):
+                continue
             
-            # Skip sqlite_sequence table
-            if table_name == 'sqlite_sequence':
+            missing = filtered - set(self._get_columns(conn, table_name))
+            if missing:
+                if table_name in named:
+                    raise ValueError(f"Table {table_name} has no column {', '.join(sorted(missing))}")
                 continue
             
-            cursor.execute(f"SELECT * FROM {table_name}")
-            rows = cursor.fetchall()
+            selected[table_name] = _where_clause(wheres)
+        
+        if filtered and not selected:
+            raise ValueError(f"No table has the filtered columns: {', '.join(sorted(filtered))}")
+        
+        return selected
+    
+    def _read_table_chunks(self, conn, table_name, chunk_size, query=None, params=()):
+        """Return a table's column names and a generator of row chunks"""
+        
+        cursor = conn.cursor()
+        cursor.execute(query or f"SELECT * FROM {table_name}", params)
+        columns = [description[0] for description in cursor.description]
+        
+        def chunks():
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                self._checkpoint(table=table_name, rows=len(rows))
+                yield rows
+        
+        return columns, chunks()
+    
+    def _compression_codec(self, compress):
+        """Return the codec for a ``compress`` argument: a codec name, True for gzip, or falsy"""
+        
+        codec = 'gzip' if compress is True else (compress or None)
+        if codec and codec not in COMPRESSION:
+            raise ValueError(f"Unsupported compression: {codec}")
+        return codec
+    
+    def _open_backup_file(self, path):
+        """Open a backup file for writing through the compression and checksum pipeline"""
+        
+        return PipelineWriter(path, compression_of(path), self.throttle)
+    
+    def _throttle(self, nbytes):
+        """Wait until ``nbytes`` more may be written under the I/O budget"""
+        
+        if self.throttle:
+            self.throttle.consume(nbytes)
+    
+    def _checkpoint(self, **progress):
+        """Report progress between chunks, raising BackupCancelled if cancelled"""
+        
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise BackupCancelled("Backup job was cancelled")
+        if self.progress:
+            self.progress(progress)
+    
+    def _discard_partial_backups(self):
+        """Delete backup files that were started but never recorded in the catalog"""
+        
+        for filepath in self._partial_paths:
+            directory, filename = os.path.split(filepath)
+            for path in (filepath, os.path.join(directory, f'.{filename}.tmp')):
+                if os.path.exists(path):
+                    os.remove(path)
+        self._partial_paths.clear()
+    
+    def _emit(self, phase, backup, table=None, rows=None, nbytes=None, seconds=None, started=None, **extra):
+        """Send an instrumentation event to every observer"""
+        
+        event = {
+            'phase': phase,
+            'backup': backup,
+            'table': table,
+            'rows': rows,
+            'bytes': nbytes,
+            'seconds': seconds,
+            'started': started if started is not None else time.time()
+        }
+        event.update(extra)
+        
+        for observer in self.observers:
+            observer(event)
+    
+    def _timer(self, backup, table_name):
+        """Return a PhaseTimer for a table, or a no-op timer when nothing observes"""
+        
+        return PhaseTimer(self._emit, backup, table_name) if self.observers else NULL_TIMER
+    
+    def _emit_pipeline(self, f):
+        """Report the compression and disk write stages of a closed PipelineWriter"""
+        
+        if not self.observers:
+            return
+        
+        backup = os.path.basename(f.path)
+        if compression_of(f.path):
+            self._emit(
+                'compress', backup, nbytes=f.stats['output_bytes'], seconds=f.stats['compress_seconds'],
+                input_bytes=f.stats['input_bytes']
+            )
+        self._emit('disk_write', backup, nbytes=f.stats['output_bytes'], seconds=f.stats['write_seconds'])
+    
+    @contextmanager
+    def _read_backup_file(self, path):
+        """Open a backup file for reading in text mode, decompressing by extension
+        
+        Bytes are hashed as they are read, and the checksum recorded in the
+        catalog is verified once the caller is done, so no separate pass
+        over the file is needed.
+        """
+        
+        raw = HashingReader(open(path, 'rb'))
+        binary = io.BufferedReader(raw)
+        codec = compression_of(path)
+        if codec:
+            binary = COMPRESSION[codec][1](binary, 'rb')
+        f = io.TextIOWrapper(binary, encoding='utf-8')
+        
+        try:
+            yield f
+            checksum = raw.hexdigest()
+        finally:
+            f.close()
+        
+        entry = self.catalog.get(os.path.basename(path))
+        if entry and entry['checksum'] and entry['checksum'] != checksum:
+            raise ValueError(f"Backup {entry['filename']} failed checksum verification")
+    
+    def _write_json(self, conn, f, chunk_size, selected):
+        """Write the selected tables as a single JSON document, one row at a time"""
+        
+        f.write('{\n')
+        f.write(f'  "export_date": {json.dumps(datetime.now().isoformat())},\n')
+        f.write('  "tables": {')
+        row_counts = {}
+        digests = {}
+        
+        for index, (table_name, (clause, params)) in enumerate(selected.items()):
+            f.write(',\n' if index else '\n')
+            f.write(f'    {json.dumps(table_name)}: [')
+            
+            timer = self._timer(os.path.basename(f.path), table_name)
+            columns, chunks = self._read_table_chunks(
+                conn, table_name, chunk_size, f"SELECT * FROM {table_name}{clause}", params
+            )
+            separator = '\n'
+            row_counts[table_name] = 0
+            digest = RowsDigest()
+            for rows in chunks:
+                timer.lap('read', len(rows))
+                texts = [_encode_row(row, columns) for row in rows]
+                digest.update(texts)
+                text = separator + ',\n'.join('      ' + text for text in texts)
+                separator = ',\n'
+                timer.lap('serialize', len(rows), text)
+                f.write(text)
+                timer.lap('write', len(rows), text)
+                row_counts[table_name] += len(rows)
+            digests[table_name] = digest.hexdigest()
+            timer.finish()
             
-            data['tables'][table_name] = [dict(row) for row in rows]
+            f.write(']' if separator == '\n' else '\n    ]')
         
-        # Write to JSON file
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+        f.write('\n  }\n}\n')
         
-        conn.close()
+        return row_counts, digests
+    
+    def _write_ndjson(self, conn, f, chunk_size, selected):
+        """Write the selected tables as NDJSON: a header line per table, then its rows"""
         
-        return filepath
+        f.write(json.dumps({'export_date': datetime.now().isoformat(), 'format': 'ndjson'}) + '\n')
+        row_counts = {}
+        digests = {}
+        
+        for table_name, (clause, params) in selected.items():
+            timer = self._timer(os.path.basename(f.path), table_name)
+            columns, chunks = self._read_table_chunks(
+                conn, table_name, chunk_size, f"SELECT * FROM {table_name}{clause}", params
+            )
+            f.write(json.dumps({'table': table_name, 'columns': columns}, ensure_ascii=False) + '\n')
+            
+            row_counts[table_name] = 0
+            digest = RowsDigest()
+            for rows in chunks:
+                timer.lap('read', len(rows))
+                lines = [_encode_row(row) for row in rows]
+                digest.update(lines)
+                text = '\n'.join(lines) + '\n'
+                timer.lap('serialize', len(rows), text)
+                f.write(text)
+                timer.lap('write', len(rows), text)
+                row_counts[table_name] += len(rows)
+            digests[table_name] = digest.hexdigest()
+            timer.finish()
+        
+        return row_counts, digests
     
     def list_backups(self):
-        """List all backup files"""
+        """List all backup files, newest first, from the backup catalog"""
         
-        backups = []
+        return [self._backup_info(entry) for entry in self.catalog.entries()]
+    
+    def _backup_info(self, entry):
+        """Add path, datetime and extension fields to a catalog entry"""
         
-        for filename in os.listdir(self.backup_dir):
-            filepath = os.path.join(self.backup_dir, filename)
+        return dict(
+            entry,
+            filepath=os.path.join(self.backup_dir, entry['filename']),
+            created_at=datetime.fromisoformat(entry['created_at']),
+            extension=os.path.splitext(entry['filename'])[1]
+        )
+    
+    def cleanup_old_backups(self):
+        """Delete backups older than retention period
+        
+        Expired backups that a newer delta backup still depends on are kept.
+        """
+        
+        cutoff_date = datetime.now() - timedelta(days=Config.BACKUP_RETENTION_DAYS)
+        entries = self.catalog.entries()
+        expired = {entry['filename'] for entry in self.catalog.entries(before=cutoff_date)}
+        keep = self._with_ancestors(
+            {entry['filename'] for entry in entries if entry['filename'] not in expired},
+            entries
+        )
+        
+        deleted = [
+            entry for entry in entries
+            if entry['filename'] in expired and entry['filename'] not in keep and self._delete_backup(entry)
+        ]
+        
+        if any(entry['format'] == 'cas.json' for entry in deleted):
+            self.collect_chunks()
+        
+        return len(deleted)
+    
+    def apply_retention(self, policy=None, max_bytes=None, dry_run=False):
+        """Prune backups with a grandfather-father-son policy
+        
+        ``policy`` maps the tiers ``hourly``, ``daily``, ``weekly`` and
+        ``monthly`` to how many periods to keep; the newest backup of each
+        period is kept, as is the newest backup overall. Partial backups
+        (taken with ``tables`` or ``where``) never stand in for a period, so
+        they are pruned. Backups a kept delta depends on are always kept. If the kept set is larger than
+        ``max_bytes``, the oldest backups nothing depends on are dropped until
+        it fits; if that is not enough, a message reports the size kept.
+        Works purely from the catalog. Returns the entries that were deleted,
+        or that would be with ``dry_run``.
+        """
+        
+        policy = Config.BACKUP_RETENTION_POLICY if policy is None else policy
+        max_bytes = Config.BACKUP_MAX_TOTAL_BYTES if max_bytes is None else max_bytes
+        
+        # Newest first
+        entries = self.catalog.entries()
+        # A partial backup cannot replace a full one
+        complete = [entry for entry in entries if entry['type'] != 'partial']
+        if not complete:
+            return []
+        
+        keep = {complete[0]['filename']}
+        for tier, count in policy.items():
+            period_of = RETENTION_TIERS[tier]
+            periods = set()
             
-            if os.path.isfile(filepath) and filename.startswith('qat_backup_'):
-                stat = os.stat(filepath)
+            for entry in complete:
+                if len(periods) >= count:
+                    break
                 
-                backups.append({
-                    'filename': filename,
-                    'filepath': filepath,
-                    'size': stat.st_size,
-                    'created_at': datetime.fromtimestamp(stat.st_ctime),
-                    'extension': os.path.splitext(filename)[1]
-                })
+                period = period_of(datetime.fromisoformat(entry['created_at']))
+                if period not in periods:
+                    periods.add(period)
+                    keep.add(entry['filename'])
+        
+        keep = self._with_ancestors(keep, entries)
         
-        # Sort by creation date (newest first)
-        backups.sort(key=lambda x: x['created_at'], reverse=True)
+        if max_bytes:
+            total = sum(entry['size'] or 0 for entry in entries if entry['filename'] in keep)
+            
+            # Drop the oldest backup nothing depends on, never the newest one;
+            # dropping a delta can free its parent for the next round
+            while total > max_bytes:
+                kept = [entry for entry in entries if entry['filename'] in keep]
+                parents = {entry['parent'] for entry in kept}
+                droppable = [entry for entry in kept[1:] if entry['filename'] not in parents]
+                if not droppable:
+                    break
+                
+                keep.discard(droppable[-1]['filename'])
+                total -= droppable[-1]['size'] or 0
+            
+            if total > max_bytes:
+                print(
+                    f"Retention keeps {total} bytes, over max_bytes={max_bytes}: "
+                    f"the remaining backups are the newest or part of a kept delta chain"
+                )
+        
+        pruned = [entry for entry in entries if entry['filename'] not in keep]
+        
+        if not dry_run:
+            pruned = [entry for entry in pruned if self._delete_backup(entry)]
+            
+            if any(entry['format'] == 'cas.json' for entry in pruned):
+                self.collect_chunks()
         
-        return backups
+        return pruned
     
-    def cleanup_old_backups(self):
-        """Delete backups older than retention period"""
+    def _chain_length(self, entry):
+        """Return how many deltas lead from a chain's full backup to ``entry``"""
         
-        cutoff_date = datetime.now() - timedelta(days=Config.BACKUP_RETENTION_DAYS)
-        deleted_count = 0
+        length = 0
+        while entry and entry['parent']:
+            length += 1
+            entry = self.catalog.get(entry['parent'])
+        return length
+    
+    def _with_ancestors(self, filenames, entries):
+        """Return ``filenames`` plus every backup their delta chains depend on"""
+        
+        parents = {entry['filename']: entry['parent'] for entry in entries}
+        result = set()
+        
+        for filename in filenames:
+            while filename and filename not in result:
+                result.add(filename)
+                filename = parents.get(filename)
+        
+        return result
+    
+    def _delete_backup(self, entry):
+        """Delete a backup file and its catalog entry"""
+        
+        filepath = os.path.join(self.backup_dir, entry['filename'])
+        
+        try:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            self.catalog.remove(entry['filename'])
+            return True
+        except Exception as e:
+            print(f"Error deleting {entry['filename']}: {e}")
+            return False
+    
+    def restore_from_backup(self, backup_path, tables=None, where=None):
+        """Restore database from backup file
+        
+        The backup is bulk-loaded into a shadow database next to the live
+        one, checked with ``PRAGMA integrity_check`` and row counts, and
+        then swapped in with an atomic rename, so the live database is never
+        empty or half-restored. Processes holding open connections should
+        reconnect after the swap; the Node server's store (store.js) checks
+        for it before every save and every few seconds, then reopens the file
+        and reloads, dropping changes it had not saved yet. Returns per-table statistics:
+        ``{table: {'rows', 'seconds', 'rows_per_sec', 'started'}}``.
+        
+        ``tables`` and ``where`` (as in ``export_to_json``) restore only
+        part of the backup, and a partial backup only ever restores the
+        rows it was taken with; see ``_restore_selected``.
+        """
+        
+        engine = engine_for_path(backup_path)
+        entry = self.catalog.get(os.path.basename(backup_path))
+        selections = [entry and entry.get('selection'), _new_selection(tables, where)]
         
-        for backup in self.list_backups():
-            if backup['created_at'] < cutoff_date:
+        # Take a fast snapshot of the current database
+        self.export_snapshot(sleep=0)
+        
+        started = time.perf_counter()
+        
+        if any(selections):
+            stats = self._restore_selected(engine, backup_path, *selections)
+        else:
+            stats = self._restore_all(engine, backup_path)
+        
+        if self.observers:
+            backup = os.path.basename(backup_path)
+            duration = time.perf_counter() - started
+            for table_name, table_stats in stats.items():
+                self._emit(
+                    'restore_insert', backup, table_name, rows=table_stats['rows'],
+                    seconds=table_stats['seconds'], started=table_stats['started']
+                )
+            self._emit(
+                'restore', backup, rows=sum(table_stats['rows'] for table_stats in stats.values()),
+                nbytes=os.path.getsize(backup_path), seconds=duration, started=time.time() - duration,
+                format=backup_format_of(os.path.basename(backup_path))
+            )
+        
+        return stats
+    
+    def _restore_all(self, engine, backup_path):
+        """Rebuild the whole database from a backup in a shadow file and swap it in"""
+        
+        shadow_path = self.db_path + Config.BACKUP_SHADOW_SUFFIX
+        if os.path.exists(shadow_path):
+            os.remove(shadow_path)
+        
+        try:
+            conn = sqlite3.connect(shadow_path)
+            
+            try:
+                self._copy_schema(conn)
+                
+                with BulkLoader(conn, self._checkpoint) as loader:
+                    self._load_backup(engine, backup_path, loader)
+                
+                # Replaced rows are counted as loaded, so deltas can only be bounded
+                self._validate_shadow(conn, loader.stats, exact=not engine.incremental)
+            finally:
+                conn.close()
+            
+            self._swap_in(shadow_path)
+        except Exception:
+            if os.path.exists(shadow_path):
+                os.remove(shadow_path)
+            raise
+        
+        return loader.stats
+    
+    def _restore_selected(self, engine, backup_path, *selections):
+        """Replace only the selected rows of the live database with a backup's
+        
+        Only the selected tables of the backup are loaded into a scratch
+        database, which is then attached to the live one. In a single
+        transaction each table has its live rows matching the filter
+        deleted and the matching backup rows copied in, with the filter
+        evaluated by SQLite on both sides. Other tables and rows are left
+        as they are. The statistics also count the ``deleted`` rows.
+        """
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            selected = self._select_tables(conn, *selections)
+        finally:
+            conn.close()
+        
+        scratch_path = self.db_path + Config.BACKUP_SHADOW_SUFFIX
+        if os.path.exists(scratch_path):
+            os.remove(scratch_path)
+        
+        try:
+            conn = sqlite3.connect(scratch_path)
+            try:
+                self._copy_schema(conn, tables_only=True)
+                with BulkLoader(conn, self._checkpoint, tables=selected) as loader:
+                    self._load_backup(engine, backup_path, loader)
+            finally:
+                conn.close()
+            
+            conn = sqlite3.connect(self.db_path)
+            conn.isolation_level = None
+            stats = {}
+            
+            try:
+                conn.execute("ATTACH DATABASE ? AS backup", (scratch_path,))
+                conn.execute("BEGIN IMMEDIATE")
+                
                 try:
-                    os.remove(backup['filepath'])
-                    deleted_count += 1
-                except Exception as e:
-                    print(f"Error deleting {backup['filename']}: {e}")
+                    for table_name, (clause, params) in selected.items():
+                        self._checkpoint(table=table_name, rows=0)
+                        table_started = time.perf_counter()
+                        columns_str = ', '.join(self._get_columns(conn, table_name))
+                        
+                        deleted = conn.execute(f"DELETE FROM main.{table_name}{clause}", params).rowcount
+                        rows = conn.execute(
+                            f"INSERT INTO main.{table_name} ({columns_str}) "
+                            f"SELECT {columns_str} FROM backup.{table_name}{clause}",
+                            params
+                        ).rowcount
+                        
+                        seconds = time.perf_counter() - table_started
+                        stats[table_name] = {
+                            'rows': rows,
+                            'deleted': deleted,
+                            'seconds': seconds,
+                            'started': time.time() - seconds,
+                            'rows_per_sec': rows / seconds if seconds else 0.0
+                        }
+                    
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                
+                conn.execute("DETACH DATABASE backup")
+            finally:
+                conn.close()
+        finally:
+            if os.path.exists(scratch_path):
+                os.remove(scratch_path)
         
-        return deleted_count
+        return stats
     
-    def restore_from_backup(self, backup_path):
-        """Restore database from backup file"""
+    def diff_backup(self, backup_path, apply=False, range_rows=None):
+        """Compare a backup with the live database row by row
         
-        # Create backup of current database
-        self.export_to_excel()
+        The backup is loaded into a scratch database with the live schema,
+        then every table is walked in primary-key order (rowid for tables
+        without one) in keyset ranges of ``range_rows`` backup rows. Each
+        range is checked as a whole inside SQLite and only ranges that
+        differ are compared row by row in Python, so unchanged data never
+        leaves the database engine. A partial backup is only compared with
+        the tables and rows of its catalog selection, so rows it never held
+        are not reported as deletes.
+        
+        Returns ``{'backup', 'seconds', 'tables': {table: {...}}}`` where
+        each table has its ``key`` and ``columns``, the ``inserts`` and
+        ``updates`` that would make the live table match the backup (rows
+        of key values followed by column values), the ``deletes`` (keys),
+        and how many ``ranges`` were checked and ``changed_ranges`` diffed.
+        With ``apply`` the changes are written with ``apply_diff``.
+        """
+        
+        range_rows = range_rows or Config.BACKUP_DIFF_RANGE_ROWS
+        engine = engine_for_path(backup_path)
+        entry = self.catalog.get(os.path.basename(backup_path))
+        selection = entry and entry.get('selection')
+        started = time.perf_counter()
+        
+        scratch_path = self.db_path + Config.BACKUP_DIFF_SUFFIX
+        if os.path.exists(scratch_path):
+            os.remove(scratch_path)
+        
+        try:
+            conn = sqlite3.connect(scratch_path)
+            try:
+                # Primary keys are part of the tables; indexes would only slow the load
+                self._copy_schema(conn, tables_only=True)
+                with BulkLoader(conn, self._checkpoint) as loader:
+                    self._load_backup(engine, backup_path, loader)
+            finally:
+                conn.close()
+            
+            conn = sqlite3.connect(self.db_path)
+            try:
+                conn.execute("ATTACH DATABASE ? AS backup", (scratch_path,))
+                
+                # Compare against one snapshot of the live database
+                conn.execute('BEGIN')
+                tables = {
+                    table_name: self._diff_table(conn, table_name, range_rows, selection and selection['where'])
+                    for table_name in self._select_tables(conn, selection)
+                }
+                conn.rollback()
+                conn.execute("DETACH DATABASE backup")
+            finally:
+                conn.close()
+        finally:
+            if os.path.exists(scratch_path):
+                os.remove(scratch_path)
+        
+        diff = {
+            'backup': os.path.basename(backup_path),
+            'seconds': time.perf_counter() - started,
+            'tables': tables
+        }
+        
+        if apply:
+            self.apply_diff(diff)
+        
+        return diff
+    
+    def apply_diff(self, diff):
+        """Write the changes found by ``diff_backup`` to the live database
+        
+        A snapshot is taken first, and all tables are changed in a single
+        transaction, so the live database either matches the backup or is
+        left as it was. Returns the number of changed rows per table.
+        """
+        
+        # Take a fast snapshot of the current database
+        self.export_snapshot(sleep=0)
         
-        # Connect to database
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn.isolation_level = None
+        counts = {}
         
-        # Clear existing data (keep structure)
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            
+            for table_name, table in diff['tables'].items():
+                key, columns = table['key'], table['columns']
+                key_width = len(key)
+                key_match = f"({', '.join(key)}) = ({', '.join(['?' for _ in key])})"
+                
+                # Tables keyed by rowid need it inserted explicitly
+                insert_columns = key + columns if key == ['rowid'] else columns
+                placeholders = ', '.join(['?' for _ in insert_columns])
+                
+                conn.executemany(f"DELETE FROM {table_name} WHERE {key_match}", table['deletes'])
+                conn.executemany(
+                    f"UPDATE {table_name} SET {', '.join(f'{column} = ?' for column in columns)} WHERE {key_match}",
+                    (list(row[key_width:]) + list(row[:key_width]) for row in table['updates'])
+                )
+                conn.executemany(
+                    f"INSERT INTO {table_name} ({', '.join(insert_columns)}) VALUES ({placeholders})",
+                    (row if key == ['rowid'] else row[key_width:] for row in table['inserts'])
+                )
+                
+                counts[table_name] = {
+                    'inserts': len(table['inserts']),
+                    'updates': len(table['updates']),
+                    'deletes': len(table['deletes'])
+                }
+            
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        
+        return counts
+    
+    def _diff_table(self, conn, table_name, range_rows, where=None):
+        """Diff one table between the attached ``backup`` schema and ``main``
         
-        for table_name in tables:
-            table_name = table_name[0]
-            if table_name != 'sqlite_sequence':
-                cursor.execute(f"DELETE FROM {table_name}")
+        Each key range is compared inside SQLite: the ranges match when both
+        sides have as many rows and no backup row is missing from the live
+        side. Only ranges that differ are read into Python. ``where`` (a
+        selection's row filters) limits both sides to the matching rows.
+        """
+        
+        key = self._get_key(conn, table_name)
+        columns = self._get_columns(conn, table_name)
+        key_width = len(key)
+        key_str = ', '.join(key)
+        key_params = f"({', '.join(['?' for _ in key])})"
+        selected = ', '.join(key + columns)
+        # Compare text byte for byte, whatever the column collation
+        compared = ', '.join(f'{column} COLLATE BINARY' for column in key + columns)
+        
+        result = {
+            'key': key, 'columns': columns, 'inserts': [], 'updates': [], 'deletes': [],
+            'ranges': 0, 'changed_ranges': 0
+        }
+        filters, filter_params = _where_conditions([where] if where else [])
+        after = None
+        
+        while True:
+            # The range ends at the key of its last backup row, and the last range is open
+            conditions, params = list(filters), filter_params
+            if after is not None:
+                conditions.append(f"({key_str}) > {key_params}")
+                params += after
+            query = f"SELECT {key_str} FROM backup.{table_name}"
+            if conditions:
+                query += f" WHERE {' AND '.join(conditions)}"
+            upto = conn.execute(f"{query} ORDER BY {key_str} LIMIT 1 OFFSET {range_rows - 1}", params).fetchone()
+            
+            conditions, params = list(filters), filter_params
+            if after is not None:
+                conditions.append(f"({key_str}) > {key_params}")
+                params += after
+            if upto is not None:
+                conditions.append(f"({key_str}) <= {key_params}")
+                params += upto
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+            
+            def select(schema, what=compared):
+                return f"SELECT {what} FROM {schema}.{table_name}{where}"
+            
+            result['ranges'] += 1
+            same = conn.execute(
+                f"SELECT ({select('backup', 'count(*)')}) = ({select('main', 'count(*)')}) "
+                f"AND NOT EXISTS ({select('backup')} EXCEPT {select('main')})",
+                params * 4
+            ).fetchone()[0]
+            
+            if not same:
+                result['changed_ranges'] += 1
+                backup_rows = conn.execute(select('backup', selected), params).fetchall()
+                live_rows = conn.execute(select('main', selected), params).fetchall()
+                self._diff_rows(backup_rows, live_rows, key_width, result)
+            
+            if upto is None:
+                break
+            self._checkpoint(table=table_name, rows=range_rows)
+            after = upto
+        
+        return result
+    
+    def _diff_rows(self, backup_rows, live_rows, key_width, result):
+        """Add the row-level differences of one key range to a table diff"""
+        
+        live = {row[:key_width]: row for row in live_rows}
+        
+        for row in backup_rows:
+            current = live.pop(row[:key_width], None)
+            if current is None:
+                result['inserts'].append(row)
+            elif current != row:
+                result['updates'].append(row)
+        
+        result['deletes'].extend(live)
+    
+    def _get_key(self, conn, table_name):
+        """Return a table's primary key columns, or ``['rowid']`` if it has none"""
+        
+        cursor = conn.execute(f"PRAGMA table_info({table_name})")
+        key = sorted((row[5], row[1]) for row in cursor.fetchall() if row[5])
+        return [column for _, column in key] or ['rowid']
+    
+    def _load_backup(self, engine, backup_path, loader):
+        """Load a backup, and for incremental engines its whole chain, into ``loader``"""
+        
+        paths = self._get_restore_chain(backup_path) if engine.incremental else [backup_path]
+        for path in paths:
+            engine.restore(self, path, loader)
+    
+    def _copy_schema(self, conn, tables_only=False):
+        """Create the live database's tables, indexes, views and triggers in ``conn``"""
+        
+        live = sqlite3.connect(self.db_path)
+        
+        try:
+            cursor = live.cursor()
+            cursor.execute(
+                "SELECT sql FROM sqlite_master "
+                "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+                + ("AND type = 'table' " if tables_only else "") +
+                "ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END"
+            )
+            statements = [row[0] for row in cursor.fetchall()]
+        finally:
+            live.close()
+        
+        for sql in statements:
+            conn.execute(sql)
         
         conn.commit()
+    
+    def _validate_shadow(self, conn, stats, exact=True):
+        """Check a restored shadow database before it is swapped in"""
+        
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != 'ok':
+            raise ValueError(f"Restored database failed integrity check: {result}")
+        
+        for table_name, table_stats in stats.items():
+            count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            
+            if count > table_stats['rows'] or (exact and count != table_stats['rows']):
+                raise ValueError(
+                    f"Restored table {table_name} has {count} rows, "
+                    f"expected {table_stats['rows']}"
+                )
+    
+    def _swap_in(self, shadow_path):
+        """Atomically replace the live database file with a restored shadow
+        
+        Connections opened before the swap keep the old, unlinked file;
+        anything they write afterwards is lost until they reopen the path.
+        """
+        
+        # Make the shadow durable before it becomes the live database
+        fd = os.open(shadow_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        # Fold the live WAL into the main file so no stale log outlives it
+        live = sqlite3.connect(self.db_path)
+        try:
+            live.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            live.close()
+        
+        os.replace(shadow_path, self.db_path)
+        
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+        
+        # Persist the rename itself
+        if os.name == 'posix':
+            fd = os.open(os.path.dirname(os.path.abspath(self.db_path)), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+    
+    def verify_backups(self, filenames=None, workers=None, report_path=None):
+        """Verify many backups at once on a process pool
         
-        # Restore from backup based on file type
-        if backup_path.endswith('.json'):
-            self._restore_from_json(backup_path, conn)
-        elif backup_path.endswith('.xlsx'):
-            self._restore_from_excel(backup_path, conn)
+        Each backup in ``filenames`` (default: every backup in the catalog)
+        is checked by ``verify_backup`` in its own worker process. Returns a
+        JSON-serializable report, also written to ``report_path`` if given.
+        """
+        
+        if filenames is None:
+            filenames = [entry['filename'] for entry in self.catalog.entries()]
+        workers = workers or Config.BACKUP_WORKERS or os.cpu_count()
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_verify_backup, [self.db_path] * len(filenames), filenames))
+        
+        report = {
+            'verified_at': datetime.now().isoformat(),
+            'ok': all(result['ok'] for result in results),
+            'backups': results
+        }
+        
+        if report_path:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        
+        return report
+    
+    def verify_backup(self, filename):
+        """Check that a backup restores to what the catalog says it contains
+        
+        The stored checksum is verified, the file is parsed and restored into
+        a temporary in-memory database, and each table's row count and
+        ``RowsDigest`` are compared with the catalog entry.
+        """
+        
+        started = time.perf_counter()
+        result = {'filename': filename, 'ok': False, 'errors': [], 'tables': {}}
+        entry = self.catalog.get(filename)
+        filepath = os.path.join(self.backup_dir, filename)
+        
+        if entry is None:
+            result['errors'].append('not in the backup catalog')
+        elif not os.path.exists(filepath):
+            result['errors'].append('file is missing')
         else:
-            raise ValueError("Unsupported backup file format")
+            result['format'] = entry['format']
+            conn = sqlite3.connect(':memory:')
+            
+            try:
+                engine = engine_for_path(filename)
+                
+                with ScratchLoader(conn) as loader:
+                    if not engine.streams_checksum and entry['checksum'] and file_checksum(filepath) != entry['checksum']:
+                        raise ValueError(f"Backup {filename} failed checksum verification")
+                    
+                    # Only this file, not its chain: digests cover the rows it holds
+                    engine.restore(self, filepath, loader)
+                
+                # JSON documents serialize rows as objects, everything else as arrays
+                as_objects = engine.name == 'json'
+                expected_rows = entry['tables'] or {}
+                expected_digests = entry['digests'] or {}
+                restored = set(self._get_tables(conn))
+                
+                for table_name in sorted(set(expected_rows) | restored):
+                    table = {'expected_rows': expected_rows.get(table_name), 'rows': 0}
+                    digest = RowsDigest()
+                    
+                    if table_name in restored:
+                        cursor = conn.execute(f'SELECT * FROM "{table_name}"')
+                        columns = [description[0] for description in cursor.description] if as_objects else None
+                        for rows in iter(lambda: cursor.fetchmany(Config.BACKUP_CHUNK_SIZE), []):
+                            digest.update(_encode_row(row, columns) for row in rows)
+                            table['rows'] += len(rows)
+                    
+                    table['ok'] = table['rows'] == table['expected_rows']
+                    if table_name in expected_digests:
+                        table['expected_digest'] = expected_digests[table_name]
+                        table['digest'] = digest.hexdigest()
+                        table['ok'] = table['ok'] and table['digest'] == table['expected_digest']
+                    
+                    if not table['ok']:
+                        result['errors'].append(f"table {table_name} does not match the catalog")
+                    result['tables'][table_name] = table
+            except Exception as e:
+                result['errors'].append(str(e))
+            finally:
+                conn.close()
         
-        conn.close()
+        result['ok'] = not result['errors']
+        result['seconds'] = time.perf_counter() - started
+        return result
     
-    def _restore_from_json(self, json_path, conn):
+    def _restore_from_json(self, json_path, loader):
         """Restore from JSON backup"""
         
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        if strip_compression(json_path).endswith('.ndjson'):
+            self._restore_from_ndjson(json_path, loader)
+            return
         
-        cursor = conn.cursor()
+        for table_name, columns, rows in self._read_json_sections(json_path):
+            loader.load(table_name, columns, rows)
+    
+    def _read_json_sections(self, json_path):
+        """Yield ``(table, columns, rows)`` for each non-empty table of a JSON backup
         
-        for table_name, rows in data['tables'].items():
-            if not rows:
-                continue
+        ``_write_json`` puts every row on a line of its own, so ``rows`` reads
+        the file lazily, one row at a time. Indented backups written before
+        that layout are parsed as a whole.
+        """
+        
+        decoder = json.JSONDecoder()
+        indented = False
+        
+        with self._read_backup_file(json_path) as f:
+            lines = (line.strip() for line in f)
             
-            # Get column names
-            columns = rows[0].keys()
-            columns_str = ', '.join(columns)
-            placeholders = ', '.join(['?' for _ in columns])
+            def table_rows(line, columns):
+                while line.startswith('{'):
+                    row = json.loads(line.rstrip(','))
+                    yield [row[col] for col in columns]
+                    line = next(lines, '')
             
-            for row in rows:
-                values = [row[col] for col in columns]
-                cursor.execute(
-                    f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders})",
-                    values
-                )
+            for line in lines:
+                # A table header looks like "name": [ and is followed by its rows;
+                # empty tables are written as "name": []
+                if not line.startswith('"'):
+                    continue
+                table_name, end = decoder.raw_decode(line)
+                if line[end:] != ': [':
+                    continue
+                
+                line = next(lines, '')
+                if line == '{':
+                    indented = True
+                    break
+                
+                columns = list(json.loads(line.rstrip(',')).keys())
+                rows = table_rows(line, columns)
+                yield table_name, columns, rows
+                
+                # Skip whatever the caller did not consume
+                rows.close()
         
-        conn.commit()
+        if indented:
+            with self._read_backup_file(json_path) as f:
+                data = json.load(f)
+            
+            for table_name, rows in data['tables'].items():
+                if rows:
+                    columns = list(rows[0].keys())
+                    yield table_name, columns, ([row[col] for col in columns] for row in rows)
     
-    def _restore_from_excel(self, excel_path, conn):
-        """Restore from Excel backup"""
+    def _restore_from_ndjson(self, ndjson_path, loader, replace=False):
+        """Restore from a streamed NDJSON backup, one table section at a time
         
-        xls = pd.ExcelFile(excel_path)
-        cursor = conn.cursor()
+        With ``replace`` existing rows are overwritten, which is how delta
+        backups are applied on top of their base.
+        """
+        
+        for table_name, columns, rows in self._read_ndjson_sections(ndjson_path):
+            loader.load(table_name, columns, rows, replace=replace)
+    
+    def _read_ndjson_sections(self, ndjson_path):
+        """Yield ``(table, columns, rows)`` for each section of an NDJSON backup
         
-        for sheet_name in xls.sheet_names:
-            df = pd.read_excel(excel_path, sheet_name=sheet_name)
+        ``rows`` is a lazy iterator over the file, so only one row is held in
+        memory at a time.
+        """
+        
+        with self._read_backup_file(ndjson_path) as f:
+            lines = (line for line in f if line.strip())
             
-            if df.empty:
-                continue
+            def is_row(line):
+                # Rows are arrays; objects are file or table headers
+                return line.lstrip().startswith('[')
+            
+            def next_section():
+                for line in lines:
+                    if not is_row(line):
+                        record = json.loads(line)
+                        if 'table' in record:
+                            return record
+                return None
             
-            # Convert NaN to None
-            df = df.where(pd.notnull(df), None)
+            def section_rows():
+                nonlocal section
+                for line in lines:
+                    if is_row(line):
+                        yield json.loads(line)
+                    else:
+                        section = json.loads(line)
+                        return
+                section = None
             
-            # Insert data
-            for _, row in df.iterrows():
-                columns = row.index.tolist()
-                values = row.tolist()
+            section = next_section()
+            while section:
+                current = section
+                rows = section_rows()
+                yield current['table'], current['columns'], rows
                 
-                columns_str = ', '.join(columns)
-                placeholders = ', '.join(['?' for _ in columns])
+                # Skip whatever the caller did not consume, without decoding it
+                if section is current:
+                    rows.close()
+                    section = next_section()
+    
+    def _restore_from_chunks(self, manifest_path, loader):
+        """Restore from a deduplicated backup manifest"""
+        
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        for table in manifest['tables']:
+            rows = (
+                json.loads(line)
+                for digest in table['chunks']
+                for line in self.chunk_store.get(digest).decode('utf-8').splitlines()
+            )
+            loader.load(table['table'], table['columns'], rows)
+    
+    def _restore_from_snapshot(self, snapshot_path, loader):
+        """Restore from a SQLite snapshot backup"""
+        
+        cursor = loader.conn.cursor()
+        cursor.execute("ATTACH DATABASE ? AS snapshot", (snapshot_path,))
+        
+        try:
+            cursor.execute("SELECT name FROM snapshot.sqlite_master WHERE type='table';")
+            tables = [row[0] for row in cursor.fetchall() if row[0] != 'sqlite_sequence']
+            
+            for table_name in tables:
+                cursor.execute(f"PRAGMA snapshot.table_info({table_name})")
+                columns = [row[1] for row in cursor.fetchall()]
                 
-                cursor.execute(
-                    f"INSERT INTO {sheet_name} ({columns_str}) VALUES ({placeholders})",
-                    values
-                )
+                loader.copy(table_name, columns, 'snapshot')
+        finally:
+            cursor.execute("DETACH DATABASE snapshot")
+    
+    def _restore_from_excel(self, excel_path, loader):
+        """Restore from Excel backup
         
-        conn.commit()
+        The workbook is parsed once for all sheets, and each sheet is
+        converted to SQLite-ready column lists in a vectorized pass before
+        being bulk-loaded.
+        """
+        
+        # Heavy, so only imported when an Excel backup is restored
+        import pandas as pd
+        
+        sheets = pd.read_excel(excel_path, sheet_name=None)
+        
+        # Worksheets split from one table map back to it through the index sheet
+        sheet_tables = {}
+        index = sheets.pop(EXCEL_INDEX_SHEET, None)
+        if index is not None:
+            sheet_tables = dict(zip(index['sheet'], index['table']))
+        
+        for sheet_name, df in sheets.items():
+            if df.empty:
+                continue
+            
+            table_name = sheet_tables.get(sheet_name, sheet_name)
+            columns = [self._to_sqlite_values(df[column]) for column in df.columns]
+            
+            loader.load(table_name, df.columns.tolist(), zip(*columns))
+    
+    def _to_sqlite_values(self, series):
+        """Convert a DataFrame column to a list of SQLite-compatible values"""
+        
+        import pandas as pd
+        
+        missing = series.isna()
+        
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime(SQLITE_DATETIME_FORMAT)
+        elif pd.api.types.is_float_dtype(series) and missing.any() and (series[~missing] % 1 == 0).all():
+            # Integer columns with blanks are read back as floats
+            series = series.astype('Int64')
+        
+        # Convert NaN/NaT to None
+        return series.astype(object).where(~missing, None).tolist()
+
+
+def _encode_row(row, columns=None):
+    """Serialize a row as a JSON array, or as an object when ``columns`` is given"""
+    
+    if columns is not None:
+        row = dict(zip(columns, row))
+    else:
+        row = list(row)
+    return json.dumps(row, ensure_ascii=False, default=str)
+
+
+def _discard_workbook(workbook):
+    """Close the write-only sheets of an unsaved workbook and delete their temp files"""
+    for worksheet in workbook.worksheets:
+        writer = worksheet._writer
+        if writer is None or worksheet.closed:
+            continue
+        try:
+            worksheet.close()
+        except Exception:
+            pass
+        if os.path.exists(writer.out):
+            writer.cleanup()
+
+
+def _new_selection(tables=None, where=None):
+    """Return the catalog record of a partial backup or restore, or None for everything
+    
+    ``tables`` is a table name or a list of them, and ``where`` is checked
+    and converted to JSON values: ``{column: {operator: value}}``.
+    """
+    
+    if tables is None and not where:
+        return None
+    if isinstance(tables, str):
+        tables = [tables]
+    
+    normalized = {}
+    for column, condition in (where or {}).items():
+        if not isinstance(condition, dict):
+            condition = {'in': condition} if isinstance(condition, (list, tuple, set)) else {'=': condition}
+        
+        normalized[column] = {}
+        for operator, value in condition.items():
+            operator = operator.lower()
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            if operator in ('in', 'not in'):
+                value = [_filter_value(v) for v in value]
+            else:
+                value = _filter_value(value)
+            normalized[column][operator] = value
+    
+    return {'tables': sorted(tables) if tables is not None else None, 'where': normalized}
+
+
+def _filter_value(value):
+    # Compare dates the way SQLAlchemy stores them
+    if isinstance(value, datetime):
+        return value.strftime(SQLITE_DATETIME_FORMAT)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _where_clause(wheres):
+    """Return the SQL ``WHERE`` clause and parameters matching all the row filters"""
+    
+    conditions, params = _where_conditions(wheres)
+    if not conditions:
+        return '', ()
+    return ' WHERE ' + ' AND '.join(conditions), params
+
+
+def _where_conditions(wheres):
+    """Return the SQL conditions and parameters of the row filters"""
+    
+    conditions = []
+    params = []
+    
+    for where in wheres:
+        for column, condition in where.items():
+            for operator, value in condition.items():
+                if value is None and operator in ('=', '!='):
+                    conditions.append(f"{column} IS {'NOT ' if operator == '!=' else ''}NULL")
+                elif operator in ('in', 'not in'):
+                    conditions.append(f"{column} {FILTER_OPERATORS[operator]} ({', '.join(['?' for _ in value])})")
+                    params.extend(value)
+                else:
+                    conditions.append(f"{column} {FILTER_OPERATORS[operator]} ?")
+                    params.append(value)
+    
+    return conditions, tuple(params)
+
+
+def _export_rowid_range(db_path, table_name, start, end, part_path, codec, chunk_size, throttle=None):
+    """Write one rowid range of a table as NDJSON rows
+    
+    Runs in a worker thread or process and returns the row count and the
+    ``RowsDigest`` of the range. ``throttle`` paces the uncompressed writes.
+    """
+    
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    opener = COMPRESSION[codec][1] if codec else open
+    count = 0
+    digest = RowsDigest()
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM {table_name} WHERE rowid >= ? AND rowid < ?", (start, end))
+        
+        with opener(part_path, 'wt', encoding='utf-8') as f:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                lines = [_encode_row(row) for row in rows]
+                digest.update(lines)
+                text = '\n'.join(lines) + '\n'
+                if throttle:
+                    throttle.consume(len(text))
+                f.write(text)
+                count += len(rows)
+    finally:
+        conn.close()
+    
+    return count, digest.hexdigest()
+
+
+def _verify_backup(db_path, filename):
+    """Verify one backup (runs in a worker process)"""
+    
+    return BackupManager(db_path).verify_backup(filename)
+
+
+class BulkLoader:
+    """Bulk-load rows into SQLite for a restore
+    
+    Each table is loaded with a single cached ``executemany`` statement
+    inside one transaction, with its indexes dropped during the load and
+    rebuilt afterwards. The restore-time PRAGMAs from
+    ``Config.BACKUP_RESTORE_PRAGMAS`` are applied on enter and the previous
+    values put back on exit. Per-table throughput is collected in ``stats``.
+    ``checkpoint`` is called every ``Config.BACKUP_CHUNK_SIZE`` rows, and
+    an exception it raises rolls back the table being loaded. With
+    ``tables`` the rows of any other table are skipped.
+    """
+    
+    def __init__(self, conn, checkpoint=None, tables=None):
+        self.conn = conn
+        self.checkpoint = checkpoint
+        self.tables = tables
+        self.stats = {}
+        self._statements = {}
+        self._saved_pragmas = {}
+        self._isolation_level = conn.isolation_level
+    
+    def __enter__(self):
+        # Manage transactions explicitly
+        self.conn.isolation_level = None
+        
+        for name, value in Config.BACKUP_RESTORE_PRAGMAS.items():
+            self._saved_pragmas[name] = self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+            self.conn.execute(f"PRAGMA {name} = {value}")
+        
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        for name, value in self._saved_pragmas.items():
+            self.conn.execute(f"PRAGMA {name} = {value}")
+        
+        self.conn.isolation_level = self._isolation_level
+    
+    def load(self, table_name, columns, rows, replace=False):
+        """Insert an iterable of row sequences into a table"""
+        
+        if self.tables is not None and table_name not in self.tables:
+            return
+        
+        key = (table_name, tuple(columns), replace)
+        if key not in self._statements:
+            columns_str = ', '.join(columns)
+            placeholders = ', '.join(['?' for _ in columns])
+            verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+            self._statements[key] = f"{verb} INTO {table_name} ({columns_str}) VALUES ({placeholders})"
+        
+        if self.checkpoint:
+            rows = self._checkpointed(table_name, rows)
+        
+        with self._table_transaction(table_name) as cursor:
+            cursor.executemany(self._statements[key], rows)
+    
+    def copy(self, table_name, columns, schema):
+        """Copy a table from an attached database"""
+        
+        if self.tables is not None and table_name not in self.tables:
+            return
+        
+        columns_str = ', '.join(columns)
+        if self.checkpoint:
+            self.checkpoint(table=table_name, rows=0)
+        
+        with self._table_transaction(table_name) as cursor:
+            cursor.execute(
+                f"INSERT INTO main.{table_name} ({columns_str}) "
+                f"SELECT {columns_str} FROM {schema}.{table_name}"
+            )
+    
+    def _checkpointed(self, table_name, rows):
+        """Pass rows through, calling ``checkpoint`` after every chunk of them"""
+        
+        count = 0
+        for row in rows:
+            yield row
+            count += 1
+            if count == Config.BACKUP_CHUNK_SIZE:
+                self.checkpoint(table=table_name, rows=count)
+                count = 0
+        
+        if count:
+            self.checkpoint(table=table_name, rows=count)
+    
+    @contextmanager
+    def _table_transaction(self, table_name):
+        """Run one table's load in a transaction with deferred index builds"""
+        
+        started = time.perf_counter()
+        cursor = self.conn.cursor()
+        cursor.execute("BEGIN")
+        
+        try:
+            cursor.execute(
+                "SELECT name, sql FROM main.sqlite_master "
+                "WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+                (table_name,)
+            )
+            indexes = cursor.fetchall()
+            for index_name, _ in indexes:
+                cursor.execute(f"DROP INDEX main.{index_name}")
+            
+            yield cursor
+            rows = max(cursor.rowcount, 0)
+            
+            for _, sql in indexes:
+                cursor.execute(sql)
+            
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        
+        seconds = time.perf_counter() - started
+        stats = self.stats.setdefault(table_name, {'rows': 0, 'seconds': 0.0, 'started': time.time() - seconds})
+        stats['rows'] += rows
+        stats['seconds'] += seconds
+        stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+
+
+class ScratchLoader(BulkLoader):
+    """BulkLoader that creates untyped tables as rows arrive
+    
+    Used to restore a backup into a scratch database for verification,
+    where values must be stored exactly as they appear in the backup.
+    """
+    
+    def load(self, table_name, columns, rows, replace=False):
+        self._create_table(table_name, columns)
+        super().load(table_name, columns, rows, replace)
+    
+    def copy(self, table_name, columns, schema):
+        self._create_table(table_name, columns)
+        super().copy(table_name, columns, schema)
+    
+    def _create_table(self, table_name, columns):
+        columns_str = ', '.join(f'"{column}"' for column in columns)
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({columns_str})')
+
+
+# Singleton instance, created on first access so importing this module has no side effects
+_backup_manager = None
+
+
+def get_backup_manager():
+    """Return the shared BackupManager, creating it on first use"""
+    
+    global _backup_manager
+    if _backup_manager is None:
+        _backup_manager = BackupManager()
+    return _backup_manager
+
 
-# Singleton instance
-backup_manager = BackupManager()
+def __getattr__(name):
+    # Keeps ``from backup_manager import backup_manager`` working
+    if name == 'backup_manager':
+        return get_backup_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
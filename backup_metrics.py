@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import threading
+
+# Prefix of every exported Prometheus metric
+METRIC_PREFIX = 'qat_backup'
+
+class PhaseTimer:
+    """Accumulate the time, rows and bytes of each phase of one table
+    
+    Code being timed calls ``lap`` at the end of every step; the time since
+    the previous lap is charged to the named phase. ``finish`` emits one
+    event per phase through ``emit``.
+    """
+    
+    def __init__(self, emit, backup, table):
+        self.emit = emit
+        self.backup = backup
+        self.table = table
+        self.phases = {}
+        self.started = time.time()
+        self._mark = time.perf_counter()
+    
+    def lap(self, phase, rows=0, data=None):
+        """Charge the time since the previous lap to ``phase``, with its rows and data"""
+        
+        now = time.perf_counter()
+        totals = self.phases.setdefault(phase, [0, 0, 0.0])
+        totals[0] += rows
+        totals[2] += now - self._mark
+        
+        if data is not None:
+            totals[1] += len(data.encode('utf-8')) if isinstance(data, str) else len(data)
+            # Measuring the data is not part of the next phase
+            now = time.perf_counter()
+        self._mark = now
+    
+    def finish(self):
+        for phase, (rows, nbytes, seconds) in self.phases.items():
+            self.emit(phase, self.backup, self.table, rows=rows, nbytes=nbytes, seconds=seconds, started=self.started)
+
+
+class NullTimer:
+    """Stand-in for ``PhaseTimer`` when nothing observes a backup"""
+    
+    def lap(self, phase, rows=0, data=None):
+        pass
+    
+    def finish(self):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class MetricsObserver:
+    """Backup observer that aggregates events into Prometheus metrics
+    
+    Rows, bytes and seconds are summed per phase and table into counters,
+    and the latest backup and restore are kept as gauges. ``prometheus_text``
+    renders them in the Prometheus text exposition format, and
+    ``write_prometheus`` writes them for the node exporter textfile
+    collector.
+    """
+    
+    def __init__(self):
+        self.phases = {}
+        self.latest = {}
+        self._lock = threading.Lock()
+    
+    def __call__(self, event):
+        with self._lock:
+            if event['phase'] in ('backup', 'restore'):
+                self.latest[event['phase']] = event
+                return
+            
+            key = (event['phase'], event['table'] or '')
+            totals = self.phases.setdefault(key, {'rows': 0, 'bytes': 0, 'seconds': 0.0, 'events': 0})
+            totals['rows'] += event['rows'] or 0
+            totals['bytes'] += event['bytes'] or 0
+            totals['seconds'] += event['seconds'] or 0.0
+            totals['events'] += 1
+    
+    def prometheus_text(self):
+        """Return the metrics in the Prometheus text exposition format"""
+        
+        lines = []
+        
+        def metric(name, kind, description, samples):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {description}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {kind}')
+            for labels, value in samples:
+                labels_str = ','.join(f'{label}="{_escape_label(str(v))}"' for label, v in labels.items())
+                lines.append(f'{METRIC_PREFIX}_{name}{{{labels_str}}} {value!r}')
+        
+        with self._lock:
+            phases = sorted(self.phases.items())
+            latest = dict(self.latest)
+        
+        for field, kind, description in (
+            ('seconds', 'seconds_total', 'Time spent in each backup phase per table'),
+            ('rows', 'rows_total', 'Rows processed in each backup phase per table'),
+            ('bytes', 'bytes_total', 'Bytes processed in each backup phase per table'),
+            ('events', 'events_total', 'Instrumented steps of each backup phase per table')
+        ):
+            metric(f'phase_{kind}', 'counter', description, [
+                ({'phase': phase, 'table': table}, totals[field]) for (phase, table), totals in phases
+            ])
+        
+        for operation, event in sorted(latest.items()):
+            labels = {'format': event.get('format') or ''}
+            metric(f'last_{operation}_duration_seconds', 'gauge', f'Duration of the latest {operation}',
+                   [(labels, event['seconds'])])
+            metric(f'last_{operation}_rows', 'gauge', f'Rows in the latest {operation}',
+                   [(labels, event['rows'])])
+            metric(f'last_{operation}_size_bytes', 'gauge', f'Backup file size of the latest {operation}',
+                   [(labels, event['bytes'])])
+            metric(f'last_{operation}_timestamp_seconds', 'gauge', f'Time the latest {operation} finished',
+                   [(labels, event['started'] + event['seconds'])])
+        
+        return '\n'.join(lines) + '\n'
+    
+    def write_prometheus(self, path):
+        """Write the metrics to a file, replacing it atomically"""
+        
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+
+class TraceObserver:
+    """Backup observer that records events as a JSON trace
+    
+    ``write`` saves the events in the Chrome trace event format, which
+    chrome://tracing and Perfetto display as a timeline with one lane per
+    phase.
+    """
+    
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+    
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+    
+    def trace(self):
+        """Return the recorded events as a Chrome trace document"""
+        
+        with self._lock:
+            events = list(self.events)
+        
+        return {
+            'traceEvents': [
+                {
+                    'name': event['table'] or event['backup'],
+                    'cat': event['phase'],
+                    'ph': 'X',
+                    'ts': int(event['started'] * 1e6),
+                    'dur': int((event['seconds'] or 0) * 1e6),
+                    'pid': os.getpid(),
+                    'tid': event['phase'],
+                    'args': {key: value for key, value in event.items() if key not in ('started', 'seconds')}
+                }
+                for event in events
+            ],
+            'displayTimeUnit': 'ms'
+        }
+    
+    def write(self, path):
+        """Write the trace as JSON"""
+        
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.trace(), f, ensure_ascii=False)
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
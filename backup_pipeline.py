@@ -0,0 +1,284 @@
+import io
+import bz2
+import gzip
+import lzma
+import zlib
+import time
+import queue
+import hashlib
+import threading
+from config import Config
+
+# Compression codecs: file extension, opener and streaming compressor factory
+COMPRESSION = {
+    'gzip': ('.gz', gzip.open, lambda: zlib.compressobj(wbits=31)),
+    'lzma': ('.xz', lzma.open, lzma.LZMACompressor),
+    'bz2': ('.bz2', bz2.open, bz2.BZ2Compressor)
+}
+
+
+def compression_of(path):
+    """Return the compression codec of a backup path, or None"""
+    
+    for codec, (extension, _, _) in COMPRESSION.items():
+        if path.endswith(extension):
+            return codec
+    return None
+
+
+def strip_compression(path):
+    """Return a backup path without its compression extension"""
+    
+    codec = compression_of(path)
+    return path[:-len(COMPRESSION[codec][0])] if codec else path
+
+
+def compress_bytes(data, codec):
+    """Compress a complete block of data as one stream or gzip member"""
+    
+    if not codec:
+        return data
+    
+    compressor = COMPRESSION[codec][2]()
+    return compressor.compress(data) + compressor.flush()
+
+
+class PipelineWriter:
+    """Text file writer that compresses and checksums in background threads
+    
+    The calling thread only serializes. Encoded blocks go through a bounded
+    queue to a compression thread, and from there to a thread that hashes
+    and writes them, so the three stages overlap in a single pass over the
+    data. Once closed, ``checksum`` is the SHA-256 of the bytes on disk.
+    Writes are paced by ``throttle`` (an ``IOThrottle``) if given. ``stats``
+    holds the bytes and seconds spent in the compression and write stages.
+    """
+    
+    def __init__(self, path, compression=None, throttle=None):
+        self.path = path
+        self.checksum = None
+        self.stats = {'input_bytes': 0, 'output_bytes': 0, 'compress_seconds': 0.0, 'write_seconds': 0.0}
+        self._throttle = throttle
+        self._file = open(path, 'wb')
+        self._compressor = COMPRESSION[compression][2]() if compression else None
+        self._digest = hashlib.sha256()
+        self._buffer = []
+        self._buffered = 0
+        self._error = None
+        self._closed = False
+        
+        self._compress_queue = queue.Queue(maxsize=Config.BACKUP_PIPELINE_DEPTH)
+        self._write_queue = queue.Queue(maxsize=Config.BACKUP_PIPELINE_DEPTH)
+        self._threads = [
+            threading.Thread(target=self._compress_loop, daemon=True),
+            threading.Thread(target=self._write_loop, daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def write(self, text):
+        self._buffer.append(text)
+        self._buffered += len(text)
+        
+        if self._buffered >= Config.BACKUP_PIPELINE_BLOCK_SIZE:
+            self._flush_buffer()
+        
+        return len(text)
+    
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+    
+    def close(self):
+        """Flush remaining data, stop the pipeline threads and set ``checksum``"""
+        
+        if self._closed:
+            return
+        self._closed = True
+        
+        try:
+            self._flush_buffer()
+        finally:
+            self._put(self._compress_queue, None)
+            for thread in self._threads:
+                thread.join()
+            self._file.close()
+        
+        if self._error:
+            raise self._error
+        
+        self.checksum = self._digest.hexdigest()
+    
+    def _flush_buffer(self):
+        if self._buffer:
+            self._put(self._compress_queue, ''.join(self._buffer).encode('utf-8'))
+            self._buffer = []
+            self._buffered = 0
+    
+    def _put(self, target, item):
+        """Queue an item, giving up if a pipeline thread has failed"""
+        
+        while True:
+            if self._error and item is not None:
+                raise self._error
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    
+    def _compress_loop(self):
+        while True:
+            block = self._compress_queue.get()
+            if block is None:
+                break
+            
+            # Keep draining after a failure so the producer never blocks
+            if self._error:
+                continue
+            
+            try:
+                started = time.perf_counter()
+                data = self._compressor.compress(block) if self._compressor else block
+                self.stats['compress_seconds'] += time.perf_counter() - started
+                self.stats['input_bytes'] += len(block)
+                self._write_queue.put(data)
+            except BaseException as e:
+                self._error = e
+        
+        try:
+            if self._compressor and not self._error:
+                started = time.perf_counter()
+                data = self._compressor.flush()
+                self.stats['compress_seconds'] += time.perf_counter() - started
+                self._write_queue.put(data)
+        except BaseException as e:
+            self._error = e
+        
+        self._write_queue.put(None)
+    
+    def _write_loop(self):
+        while True:
+            data = self._write_queue.get()
+            if data is None:
+                break
+            
+            if self._error:
+                continue
+            
+            try:
+                if self._throttle:
+                    self._throttle.consume(len(data))
+                started = time.perf_counter()
+                self._digest.update(data)
+                self._file.write(data)
+                self.stats['write_seconds'] += time.perf_counter() - started
+                self.stats['output_bytes'] += len(data)
+            except BaseException as e:
+                self._error = e
+
+
+class IOThrottle:
+    """Token bucket that limits backup writes to a bytes-per-second budget
+    
+    ``consume`` blocks until the bytes fit in the budget, allowing bursts of
+    up to ``burst`` bytes. Before that, ``pause`` (if given) is called
+    repeatedly and the caller sleeps for as long as it returns a positive
+    number of seconds, which lets a scheduler hold writes back under load.
+    """
+    
+    def __init__(self, bytes_per_sec, burst=None, pause=None):
+        self.bytes_per_sec = bytes_per_sec
+        self.burst = burst or bytes_per_sec
+        self.pause = pause
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def consume(self, nbytes):
+        """Wait until ``nbytes`` may be written"""
+        
+        if self.pause:
+            delay = self.pause()
+            while delay and delay > 0:
+                time.sleep(delay)
+                delay = self.pause()
+        
+        if not self.bytes_per_sec:
+            return
+        
+        # Hold the lock while sleeping so concurrent writers share one budget
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.bytes_per_sec)
+            self._updated = now
+            self._tokens -= nbytes
+            
+            if self._tokens < 0:
+                time.sleep(-self._tokens / self.bytes_per_sec)
+                self._tokens = 0
+                self._updated = time.monotonic()
+
+
+class HashingReader(io.RawIOBase):
+    """Raw binary reader that hashes every byte it reads"""
+    
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        if count:
+            self.digest.update(memoryview(buffer)[:count])
+        return count
+    
+    def close(self):
+        self.raw.close()
+        super().close()
+    
+    def hexdigest(self):
+        """Hash the rest of the file and return the digest of all of it"""
+        
+        while self.read(1024 * 1024):
+            pass
+        return self.digest.hexdigest()
+
+
+class RowsDigest:
+    """Order-independent digest of a table's serialized rows
+    
+    Each row's text is hashed with SHA-256 and the hashes are summed modulo
+    2**256, so digests of rowid ranges exported in parallel combine by
+    addition, and rows restored in a different order give the same digest.
+    """
+    
+    MODULUS = 1 << 256
+    
+    def __init__(self):
+        self.value = 0
+    
+    def update(self, texts):
+        """Add the serialized text of each row in ``texts``"""
+        
+        value = self.value
+        for text in texts:
+            value += int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest(), 'big')
+        self.value = value % self.MODULUS
+    
+    def combine(self, hexdigest):
+        """Add the rows summarized by another digest"""
+        
+        self.value = (self.value + int(hexdigest, 16)) % self.MODULUS
+    
+    def hexdigest(self):
+        return f'{self.value:064x}'
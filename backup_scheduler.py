@@ -0,0 +1,249 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from config import Config
+from backup_manager import BackupManager
+from backup_pipeline import IOThrottle
+
+# Shorthands accepted in place of a cron expression
+CRON_ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *'
+}
+# (lowest, highest) value of each cron field
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+class CronSchedule:
+    """Five-field cron expression: minute, hour, day of month, month, day of week
+    
+    Fields accept ``*``, numbers, ranges ``a-b``, lists ``a,b`` and steps
+    ``*/n`` or ``a-b/n``. Day of week runs from 0 (Sunday) to 6, 7 is also
+    Sunday. As in cron, a time matches if either day field matches when
+    both are restricted.
+    """
+    
+    def __init__(self, expression):
+        self.expression = expression
+        fields = CRON_ALIASES.get(expression, expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression: {expression}")
+        
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+        ]
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+    
+    def _parse_field(self, field, low, high):
+        """Return the set of values a cron field matches"""
+        
+        values = set()
+        
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step = part.split('/', 1)
+                step = int(step)
+            
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(value) for value in part.split('-', 1))
+            else:
+                start = end = int(part)
+            
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Invalid cron field: {field}")
+            values.update(range(start, end + 1, step))
+        
+        return values
+    
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        # datetime counts weekdays from Monday, cron from Sunday
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+    
+    def next_after(self, moment):
+        """Return the first matching minute strictly after ``moment``"""
+        
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        
+        while moment < limit:
+            if moment.month not in self.months:
+                # Jump to the first day of the next month
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        
+        raise ValueError(f"Cron expression never matches: {self.expression}")
+
+
+class BackupScheduler:
+    """Run backup policies on a cron schedule in a background thread
+    
+    Each policy is a dict with a ``name``, a ``cron`` expression, the
+    ``BackupManager`` ``method`` to call and optional ``kwargs``. Backups run
+    at a raised niceness and their writes are limited to ``bytes_per_sec``.
+    While the system is overloaded, i.e. the load signal exceeds
+    ``max_load`` or the request latency reported through ``report_latency``
+    exceeds ``max_latency``, policies are not started and running backups
+    pause their writes, backing off exponentially.
+    """
+    
+    def __init__(self, db_path='qat_app.db', policies=None, bytes_per_sec=None, niceness=None,
+                 max_load=None, max_latency=None, load_signal=None):
+        self.policies = policies if policies is not None else Config.BACKUP_SCHEDULE
+        self.schedules = {policy['name']: CronSchedule(policy['cron']) for policy in self.policies}
+        self.niceness = Config.BACKUP_NICENESS if niceness is None else niceness
+        self.max_load = Config.BACKUP_MAX_LOAD if max_load is None else max_load
+        self.max_latency = Config.BACKUP_MAX_LATENCY if max_latency is None else max_latency
+        self.load_signal = load_signal or system_load
+        
+        self.throttle = IOThrottle(
+            Config.BACKUP_IO_BYTES_PER_SEC if bytes_per_sec is None else bytes_per_sec,
+            pause=self._backoff_delay
+        )
+        self.manager = BackupManager(db_path)
+        self.manager.throttle = self.throttle
+        
+        # Last run of each policy: started_at, seconds, result, error
+        self.history = {}
+        self.latency = None
+        self._backoff = 0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start the scheduler thread"""
+        
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout=None):
+        """Stop scheduling and wait for a running backup to finish"""
+        
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+    
+    def report_latency(self, seconds):
+        """Feed a request latency sample into the moving average used for back-off"""
+        
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += 0.2 * (seconds - self.latency)
+    
+    def overloaded(self):
+        """Return True while backups should hold back"""
+        
+        if self.max_latency and self.latency is not None and self.latency > self.max_latency:
+            return True
+        if self.max_load and self.load_signal() > self.max_load:
+            return True
+        return False
+    
+    def run_policy(self, name):
+        """Run a policy now in the calling thread, waiting out any overload first"""
+        
+        policy = next((policy for policy in self.policies if policy['name'] == name), None)
+        if policy is None:
+            raise ValueError(f"Unknown backup policy: {name}")
+        
+        # Do not start a backup while the system is busy
+        delay = self._backoff_delay()
+        while delay and not self._stop.wait(delay):
+            delay = self._backoff_delay()
+        
+        started_at = datetime.now()
+        started = time.perf_counter()
+        run = {'started_at': started_at.isoformat(), 'result': None, 'error': None}
+        
+        try:
+            run['result'] = getattr(self.manager, policy['method'])(**policy.get('kwargs', {}))
+        except Exception as e:
+            run['error'] = str(e)
+            print(f"Error running backup policy {name}: {e}")
+        
+        run['seconds'] = time.perf_counter() - started
+        self.history[name] = run
+        return run
+    
+    def _run(self):
+        self._lower_priority()
+        
+        now = datetime.now()
+        next_runs = {name: schedule.next_after(now) for name, schedule in self.schedules.items()}
+        
+        while next_runs:
+            name = min(next_runs, key=next_runs.get)
+            wait = (next_runs[name] - datetime.now()).total_seconds()
+            if self._stop.wait(max(wait, 0)):
+                break
+            
+            self.run_policy(name)
+            
+            # Runs missed while this one was busy are skipped, not queued
+            next_runs[name] = self.schedules[name].next_after(max(next_runs[name], datetime.now()))
+    
+    def _lower_priority(self):
+        """Raise the niceness of the scheduler thread and the threads it starts"""
+        
+        if not self.niceness:
+            return
+        
+        try:
+            # On Linux the priority of a thread id applies to that thread only
+            thread_id = threading.get_native_id()
+            os.setpriority(os.PRIO_PROCESS, thread_id, os.getpriority(os.PRIO_PROCESS, thread_id) + self.niceness)
+        except (AttributeError, OSError):
+            pass
+    
+    def _backoff_delay(self):
+        """Return how long to pause before writing, doubling while overloaded"""
+        
+        if self._stop.is_set() or not self.overloaded():
+            self._backoff = 0
+            return 0
+        
+        self._backoff = min(self._backoff * 2 or 0.1, Config.BACKUP_BACKOFF_MAX)
+        return self._backoff
+
+
+def system_load():
+    """Return the one-minute load average per CPU, or 0 where unavailable"""
+    
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0
+
+
+if __name__ == '__main__':
+    scheduler = BackupScheduler()
+    scheduler.start()
+    
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        scheduler.stop()
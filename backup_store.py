@@ -0,0 +1,81 @@
+import os
+import gzip
+import time
+import hashlib
+
+class ChunkStore:
+    """Content-addressed store of backup chunks
+    
+    Each chunk is saved once under the SHA-256 of its content, gzip
+    compressed, in ``<root>/<first two hex digits>/<digest>``. Backups refer
+    to chunks by digest, so data that did not change between backups is
+    never written twice.
+    """
+    
+    def __init__(self, root):
+        self.root = root
+        
+        # Create store directory if not exists
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+    
+    def _path(self, digest):
+        """Return the file path of a chunk"""
+        
+        return os.path.join(self.root, digest[:2], digest)
+    
+    def put(self, data):
+        """Store a chunk unless it is already present and return its digest"""
+        
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        
+        if os.path.exists(path):
+            # Mark the chunk as in use so a concurrent sweep keeps it
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            
+            # Write under a temporary name so a crash never leaves a bad chunk
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(gzip.compress(data, mtime=0))
+            os.replace(temp_path, path)
+        
+        return digest
+    
+    def get(self, digest):
+        """Return the content of a chunk, checking it against its digest"""
+        
+        with open(self._path(digest), 'rb') as f:
+            data = gzip.decompress(f.read())
+        
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} is corrupted")
+        
+        return data
+    
+    def sweep(self, referenced, grace_seconds=0):
+        """Delete chunks not in ``referenced`` and return how many were deleted
+        
+        Chunks written or reused within the last ``grace_seconds`` are kept,
+        since a backup in progress may not be recorded yet.
+        """
+        
+        cutoff = time.time() - grace_seconds
+        deleted = 0
+        
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if not os.path.isdir(directory):
+                continue
+            
+            for digest in os.listdir(directory):
+                path = os.path.join(directory, digest)
+                if digest in referenced or digest.endswith('.tmp') or os.path.getmtime(path) > cutoff:
+                    continue
+                
+                os.remove(path)
+                deleted += 1
+        
+        return deleted
@@ -4,7 +4,8 @@ from datetime import timedelta
 class Config:
     # Security
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-change-this'
-    JWT_SECRET_KEY = SECRET_KEY
+    # Shared with server.py, which signs the tokens with the same JWT_SECRET
+    JWT_SECRET_KEY = os.environ.get('JWT_SECRET') or 'your-jwt-secret-key-change-in-production'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=30)
     
     # Database
@@ -35,6 +36,41 @@ class Config:
     # Backup settings
     BACKUP_DIR = 'backups'
     BACKUP_RETENTION_DAYS = 30
+    BACKUP_RETENTION_POLICY = {'hourly': 24, 'daily': 7, 'weekly': 4, 'monthly': 12}
+    BACKUP_MAX_TOTAL_BYTES = None  # total size budget for kept backups
+    BACKUP_CHUNK_SIZE = 1000  # rows read/written per batch when streaming
+    BACKUP_PIPELINE_BLOCK_SIZE = 1024 * 1024  # characters handed to the compression thread at once
+    BACKUP_PIPELINE_DEPTH = 8  # blocks queued between pipeline stages
+    BACKUP_SNAPSHOT_PAGES = 256  # pages copied per snapshot step
+    BACKUP_SNAPSHOT_SLEEP = 0.01  # seconds to pause between snapshot steps
+    BACKUP_CATALOG_FILE = 'catalog.db'  # backup metadata, lineage and watermarks
+    BACKUP_CHUNK_STORE_DIR = 'chunks'  # content-addressed chunks of deduplicated backups
+    BACKUP_CAS_CHUNK_ROWS = 10000  # consecutive rowids per deduplicated chunk
+    BACKUP_CHUNK_GC_GRACE = 3600  # seconds before an unreferenced chunk may be deleted
+    BACKUP_INCREMENTAL_MAX_CHAIN = 48  # deltas after which export_incremental starts a new full chain
+    BACKUP_UPDATE_COLUMNS = ('updatedAt', 'updated_at')
+    BACKUP_RESTORE_PRAGMAS = {'synchronous': 'OFF', 'journal_mode': 'MEMORY'}
+    BACKUP_SHADOW_SUFFIX = '.restore'  # shadow database built during a restore
+    BACKUP_DIFF_SUFFIX = '.diff'  # scratch copy of a backup while diffing it
+    BACKUP_DIFF_RANGE_ROWS = 1000  # backup rows per key range checked at once when diffing
+    BACKUP_WORKERS = None  # parallel export workers, defaults to the CPU count
+    BACKUP_PARALLEL_SPLIT_ROWS = 100000  # rows per rowid range in parallel exports
+    BACKUP_SCHEDULE = [
+        {'name': 'incremental-base', 'cron': '0 0 * * *', 'method': 'export_incremental', 'kwargs': {'full': True}},
+        {'name': 'incremental', 'cron': '0 1-23 * * *', 'method': 'export_incremental'},
+        {'name': 'snapshot', 'cron': '30 3 * * *', 'method': 'export_snapshot'},
+        {'name': 'retention', 'cron': '0 4 * * *', 'method': 'apply_retention'}
+    ]
+    BACKUP_IO_BYTES_PER_SEC = 10 * 1024 * 1024  # write budget of scheduled backups
+    BACKUP_NICENESS = 10  # added to the scheduler thread's niceness
+    BACKUP_MAX_LOAD = 0.75  # load average per CPU above which backups back off
+    BACKUP_MAX_LATENCY = 0.5  # average request latency in seconds above which backups back off
+    BACKUP_BACKOFF_MAX = 60  # longest pause in seconds while backing off
+    BACKUP_BENCHMARK_DIR = 'benchmarks'  # fixtures and backups written by backup_benchmark.py
+    BACKUP_JOB_WORKERS = 2  # threads running async backup and restore jobs
+    BACKUP_JOB_HISTORY = 100  # finished jobs kept for polling
+    BACKUP_API_HOST = '127.0.0.1'  # backup job endpoint of backup_async.py
+    BACKUP_API_PORT = 5001
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -8,42 +8,77 @@ const jwt = require('jsonwebtoken');
 const bcrypt = require('bcryptjs');
 const nodemailer = require('nodemailer');
 const ExcelJS = require('exceljs');
+const { openStore } = require('./store');
 
 const app = express();
 const PORT = process.env.PORT || 3000;
 
 // تهيئة قاعدة البيانات المحلية
+// البيانات في qat_app.db (جدول لكل مجموعة)، و database.json عند عدم توفر better-sqlite3
 const DB_FILE = path.join(__dirname, 'database', 'database.json');
 let database = {};
+let store = null;
+
+// الفترة بين إعادة حساب إحصائيات لوحة التحكم بالكامل (بالمللي ثانية)
+const STATS_RECONCILE_INTERVAL = parseInt(process.env.STATS_RECONCILE_INTERVAL, 10) || 10 * 60 * 1000;
+
+// الفترة بين التحقق من استبدال qat_app.db باستعادة نسخة احتياطية (بالمللي ثانية)
+const DB_RELOAD_CHECK_INTERVAL = parseInt(process.env.DB_RELOAD_CHECK_INTERVAL, 10) || 5000;
+
+// حجم الصفحة الافتراضي والأقصى في قوائم المنتجات والطلبات
+const PAGE_SIZE = 20;
+const MAX_PAGE_SIZE = 100;
 
 // تحميل قاعدة البيانات
 function loadDatabase() {
-    if (fs.existsSync(DB_FILE)) {
-        const data = fs.readFileSync(DB_FILE, 'utf8');
-        database = JSON.parse(data);
-    } else {
-        database = {
-            users: [],
-            products: [],
-            orders: [],
-            markets: [],
-            washingStations: [],
-            drivers: [],
-            advertisements: [],
-            packages: [],
-            wallets: [],
-            transactions: [],
-            notifications: [],
-            coupons: [],
-            backups: []
-        };
-        saveDatabase();
+    store = openStore({ jsonFile: DB_FILE });
+    database = store.data;
+    createIndexes();
+    createStats();
+}
+
+// فهارس البحث، تُحدَّث تلقائياً مع كل إضافة أو تعديل
+function createIndexes() {
+    store.createIndex('users', 'id', user => user.id);
+    store.createIndex('users', 'email', user => user.email);
+    store.createIndex('users', 'role', user => user.role);
+    store.createIndex('products', 'id', product => product.id);
+    store.createIndex('products', 'sellerId', product => product.sellerId);
+    store.createIndex('products', 'marketId', product => product.marketId);
+    // sellerIds تُحسب من منتجات الطلب عند إنشائه
+    store.createIndex('orders', 'sellerId', order => order.sellerIds, { multi: true });
+    store.createIndex('coupons', 'code', coupon => coupon.code);
+    store.createIndex('packages', 'id', adPackage => adPackage.id);
+    
+    // فهارس مرتبة لخيارات الترتيب في القوائم
+    store.createIndex('products', 'createdAt', product => product.createdAt, { sorted: true });
+    store.createIndex('products', 'price', product => product.price, { sorted: true });
+    store.createIndex('products', 'rating', product => product.rating, { sorted: true });
+    store.createIndex('orders', 'createdAt', order => order.createdAt, { sorted: true });
+    store.createIndex('orders', 'totalAmount', order => order.totalAmount, { sorted: true });
+}
+
+// إحصائيات لوحة التحكم، تُحدَّث مع كل تسجيل أو طلب أو تغيير حالة
+function createStats() {
+    store.createAggregate('users', 'sellers', user => user.role === 'seller');
+    store.createAggregate('users', 'buyers', user => user.role === 'buyer');
+    store.createAggregate('users', 'drivers', user => user.role === 'driver');
+    store.createAggregate('orders', 'revenue', order => order.totalAmount);
+    store.createAggregate('orders', 'pending', order => order.status === 'pending');
+    store.createAggregate('markets', 'active', market => Boolean(market.isActive));
+    store.createAggregate('washingStations', 'active', station => Boolean(station.isActive));
+}
+
+// إعادة حساب الإحصائيات من البيانات لتصحيح أي انحراف
+function reconcileStats() {
+    for (const { collection, name, before, after } of store.reconcile()) {
+        console.warn(`⚠️ تم تصحيح إحصائية ${collection}.${name}: ${before} -> ${after}`);
     }
 }
 
-// حفظ قاعدة البيانات
+// حفظ قاعدة البيانات: تُكتب السجلات التي تغيرت منذ آخر حفظ فقط
 function saveDatabase() {
-    fs.writeFileSync(DB_FILE, JSON.stringify(database, null, 2), 'utf8');
+    store.save();
 }
 
 // تكوين multer للملفات
@@ -70,7 +105,7 @@ app.use(session({
 }));
 
 // JWT Secret
-const JWT_SECRET = 'your-jwt-secret-key-change-in-production';
+const JWT_SECRET = process.env.JWT_SECRET || 'your-jwt-secret-key-change-in-production';
 
 // Middleware للمصادقة
 function authenticateToken(req, res, next) {
@@ -140,7 +175,7 @@ async function sendNotification(userId, title, message) {
     saveDatabase();
     
     // إرسال بريد إلكتروني إذا كان المستخدم مفعل الإشعارات
-    const user = database.users.find(u => u.id === userId);
+    const user = store.find('users', 'id', userId);
     if (user && user.emailNotifications) {
         await transporter.sendMail({
             from: 'qat-app@example.com',
@@ -163,7 +198,7 @@ app.post('/api/register', async (req, res) => {
         const { name, email, phone, password, role, storeName, vehicleType } = req.body;
         
         // التحقق من وجود المستخدم
-        const existingUser = database.users.find(u => u.email === email);
+        const existingUser = store.find('users', 'email', email);
         if (existingUser) {
             return res.status(400).json({ error: 'البريد الإلكتروني مسجل بالفعل' });
         }
@@ -230,7 +265,7 @@ app.post('/api/login', async (req, res) => {
         const { email, password } = req.body;
         
         // البحث عن المستخدم
-        const user = database.users.find(u => u.email === email);
+        const user = store.find('users', 'email', email);
         if (!user) {
             return res.status(400).json({ error: 'بيانات الدخول غير صحيحة' });
         }
@@ -272,15 +307,15 @@ app.post('/api/login', async (req, res) => {
 app.get('/api/admin/dashboard', authenticateToken, isAdmin, (req, res) => {
     const stats = {
         totalUsers: database.users.length,
-        totalSellers: database.users.filter(u => u.role === 'seller').length,
-        totalBuyers: database.users.filter(u => u.role === 'buyer').length,
-        totalDrivers: database.users.filter(u => u.role === 'driver').length,
+        totalSellers: store.aggregate('users', 'sellers'),
+        totalBuyers: store.aggregate('users', 'buyers'),
+        totalDrivers: store.aggregate('users', 'drivers'),
         totalProducts: database.products.length,
         totalOrders: database.orders.length,
-        totalRevenue: database.orders.reduce((sum, order) => sum + order.totalAmount, 0),
-        pendingOrders: database.orders.filter(o => o.status === 'pending').length,
-        activeMarkets: database.markets.filter(m => m.isActive).length,
-        activeWashingStations: database.washingStations.filter(w => w.isActive).length
+        totalRevenue: store.aggregate('orders', 'revenue'),
+        pendingOrders: store.aggregate('orders', 'pending'),
+        activeMarkets: store.aggregate('markets', 'active'),
+        activeWashingStations: store.aggregate('washingStations', 'active')
     };
     
     res.json({ success: true, stats });
@@ -453,12 +488,131 @@ app.get('/api/admin/backup', authenticateToken, isAdmin, async (req, res) => {
     }
 });
 
+// قراءة خيارات القائمة من الاستعلام:
+// limit و cursor و sort و order (asc أو desc) و fields (حقول مفصولة بفواصل)
+// والفلاتر category و marketId و minPrice و maxPrice و status
+function parseListQuery(query, sorts) {
+    const options = {
+        limit: PAGE_SIZE,
+        sort: query.sort || 'createdAt',
+        order: query.order || 'desc',
+        fields: query.fields ? ['id', ...query.fields.split(',').map(field => field.trim()).filter(Boolean)] : null,
+        category: query.category,
+        status: query.status,
+        marketId: undefined,
+        minPrice: undefined,
+        maxPrice: undefined,
+        after: null
+    };
+    
+    if (query.limit !== undefined) {
+        options.limit = parseInt(query.limit, 10);
+        if (!(options.limit > 0)) {
+            throw new Error('قيمة limit غير صحيحة');
+        }
+        options.limit = Math.min(options.limit, MAX_PAGE_SIZE);
+    }
+    
+    if (!sorts.includes(options.sort)) {
+        throw new Error(`الترتيب المتاح: ${sorts.join(', ')}`);
+    }
+    
+    if (!['asc', 'desc'].includes(options.order)) {
+        throw new Error('قيمة order يجب أن تكون asc أو desc');
+    }
+    
+    for (const name of ['marketId', 'minPrice', 'maxPrice']) {
+        if (query[name] !== undefined) {
+            options[name] = name === 'marketId' ? parseInt(query[name], 10) : parseFloat(query[name]);
+            if (Number.isNaN(options[name])) {
+                throw new Error(`قيمة ${name} غير صحيحة`);
+            }
+        }
+    }
+    
+    if (query.cursor) {
+        let cursor;
+        try {
+            cursor = JSON.parse(Buffer.from(query.cursor, 'base64url').toString('utf8'));
+        } catch (error) {
+            cursor = null;
+        }
+        // المؤشر صالح فقط مع الترتيب الذي أُنشئ به
+        if (!cursor || cursor.sort !== options.sort || cursor.order !== options.order || !Array.isArray(cursor.after)) {
+            throw new Error('قيمة cursor غير صحيحة');
+        }
+        options.after = cursor.after;
+    }
+    
+    return options;
+}
+
+function matchesProduct(product, options) {
+    return (options.category === undefined || product.category === options.category) &&
+        (options.marketId === undefined || product.marketId === options.marketId) &&
+        (options.minPrice === undefined || product.price >= options.minPrice) &&
+        (options.maxPrice === undefined || product.price <= options.maxPrice);
+}
+
+function matchesOrder(order, options) {
+    return options.status === undefined || order.status === options.status;
+}
+
+// صفحة من القائمة بالتصفح بمؤشر: تبدأ من بعد آخر سجل في الصفحة السابقة
+// عبر الفهرس المرتب، وتتوقف بعد limit سجل. records (إن وُجدت) سجلات من فهرس
+// تجزئة، مثل منتجات البائع، تُرتب وحدها بدل المرور على المجموعة كاملة.
+function listPage(collection, options, matches, records) {
+    const items = [];
+    let last = null;
+    let hasMore = false;
+    
+    for (const record of store.range(collection, options.sort, { after: options.after, reverse: options.order === 'desc', records })) {
+        if (!matches(record)) {
+            continue;
+        }
+        if (items.length === options.limit) {
+            hasMore = true;
+            break;
+        }
+        
+        last = record;
+        if (options.fields) {
+            const item = {};
+            for (const field of options.fields) {
+                if (field in record) {
+                    item[field] = record[field];
+                }
+            }
+            items.push(item);
+        } else {
+            items.push(record);
+        }
+    }
+    
+    const nextCursor = hasMore
+        ? Buffer.from(JSON.stringify({
+            sort: options.sort,
+            order: options.order,
+            after: store.index(collection, options.sort).entryOf(last)
+        })).toString('base64url')
+        : null;
+    
+    return { items, nextCursor };
+}
+
 // مسارات البائعين
 app.get('/api/seller/products', authenticateToken, isSeller, (req, res) => {
-    const sellerId = req.user.id;
-    const sellerProducts = database.products.filter(p => p.sellerId === sellerId);
+    let options;
+    try {
+        options = parseListQuery(req.query, ['createdAt', 'price', 'rating']);
+    } catch (error) {
+        return res.status(400).json({ error: error.message });
+    }
     
-    res.json({ success: true, products: sellerProducts });
+    const sellerProducts = store.filter('products', 'sellerId', req.user.id);
+    const { items, nextCursor } = listPage('products', options, product => matchesProduct(product, options), sellerProducts);
+    
+    res.json({ success: true, products: items, nextCursor });
 });
 
 app.post('/api/seller/products', authenticateToken, isSeller, upload.array('images', 5), (req, res) => {
@@ -493,17 +647,18 @@ app.post('/api/seller/products', authenticateToken, isSeller, upload.array('imag
 
 // طلبات البائع
 app.get('/api/seller/orders', authenticateToken, isSeller, (req, res) => {
-    const sellerId = req.user.id;
+    let options;
+    try {
+        options = parseListQuery(req.query, ['createdAt', 'totalAmount']);
+    } catch (error) {
+        return res.status(400).json({ error: error.message });
+    }
     
     // جلب طلبات منتجات البائع
-    const sellerOrders = database.orders.filter(order => 
-        order.items.some(item => {
-            const product = database.products.find(p => p.id === item.productId);
-            return product && product.sellerId === sellerId;
-        })
-    );
+    const sellerOrders = store.filter('orders', 'sellerId', req.user.id);
+    const { items, nextCursor } = listPage('orders', options, order => matchesOrder(order, options), sellerOrders);
     
-    res.json({ success: true, orders: sellerOrders });
+    res.json({ success: true, orders: items, nextCursor });
 });
 
 // سحب الأموال
@@ -512,7 +667,7 @@ app.post('/api/seller/withdraw', authenticateToken, isSeller, (req, res) => {
     const sellerId = req.user.id;
     
     // التحقق من رصيد البائع
-    const seller = database.users.find(u => u.id === sellerId);
+    const seller = store.find('users', 'id', sellerId);
     if (!seller || seller.walletBalance < amount) {
         return res.status(400).json({ error: 'رصيد غير كافي' });
     }
@@ -538,7 +693,7 @@ app.post('/api/seller/withdraw', authenticateToken, isSeller, (req, res) => {
     
     // إرسال إشعار للمدير
     sendNotification(
-        database.users.find(u => u.role === 'admin')?.id,
+        store.find('users', 'role', 'admin')?.id,
         'طلب سحب أموال',
         `طلب البائع ${seller.name} سحب مبلغ ${amount} ريال`
     );
@@ -548,14 +703,25 @@ app.post('/api/seller/withdraw', authenticateToken, isSeller, (req, res) => {
 
 // مسارات المشترين
 app.get('/api/buyer/products', authenticateToken, isBuyer, (req, res) => {
-    const products = database.products.filter(p => p.isActive && p.quantity > 0);
-    res.json({ success: true, products });
+    let options;
+    try {
+        options = parseListQuery(req.query, ['createdAt', 'price', 'rating']);
+    } catch (error) {
+        return res.status(400).json({ error: error.message });
+    }
+    
+    // مع marketId تكفي منتجات السوق من فهرسه
+    const marketProducts = options.marketId === undefined ? undefined : store.filter('products', 'marketId', options.marketId);
+    const { items, nextCursor } = listPage('products', options, product =>
+        product.isActive && product.quantity > 0 && matchesProduct(product, options), marketProducts);
+    
+    res.json({ success: true, products: items, nextCursor });
 });
 
 app.post('/api/buyer/cart/add', authenticateToken, isBuyer, (req, res) => {
     const { productId, quantity, requiresWashing } = req.body;
     
-    const product = database.products.find(p => p.id === parseInt(productId));
+    const product = store.find('products', 'id', parseInt(productId));
     if (!product) {
         return res.status(404).json({ error: 'المنتج غير موجود' });
     }
@@ -597,7 +763,7 @@ app.post('/api/buyer/order/create', authenticateToken, isBuyer, async (req, res)
         const orderItems = [];
         
         for (const item of items) {
-            const product = database.products.find(p => p.id === item.productId);
+            const product = store.find('products', 'id', item.productId);
             if (!product) {
                 return res.status(404).json({ error: `المنتج ${item.productId} غير موجود` });
             }
@@ -628,7 +794,7 @@ app.post('/api/buyer/order/create', authenticateToken, isBuyer, async (req, res)
         // تطبيق الكوبون إذا كان موجوداً
         let discount = 0;
         if (couponCode) {
-            const coupon = database.coupons.find(c => c.code === couponCode && c.isActive);
+            const coupon = store.filter('coupons', 'code', couponCode).find(c => c.isActive);
             if (coupon) {
                 if (coupon.usedCount < coupon.maxUses && new Date(coupon.expiresAt) > new Date()) {
                     discount = coupon.amount;
@@ -640,7 +806,7 @@ app.post('/api/buyer/order/create', authenticateToken, isBuyer, async (req, res)
         totalAmount -= discount;
         
         // التحقق من رصيد المشتري
-        const buyer = database.users.find(u => u.id === buyerId);
+        const buyer = store.find('users', 'id', buyerId);
         if (!buyer) {
             return res.status(404).json({ error: 'المشتري غير موجود' });
         }
@@ -658,7 +824,7 @@ app.post('/api/buyer/order/create', authenticateToken, isBuyer, async (req, res)
         const orderCode = Math.random().toString(36).substring(2, 10).toUpperCase();
         
         // البحث عن مغسلة في نفس السوق
-        const firstProduct = database.products.find(p => p.id === items[0].productId);
+        const firstProduct = store.find('products', 'id', items[0].productId);
         const washingStation = database.washingStations.find(w => 
             w.marketId === firstProduct.marketId && w.isActive
         );
@@ -683,7 +849,7 @@ app.post('/api/buyer/order/create', authenticateToken, isBuyer, async (req, res)
             washingStationId: washingStation ? washingStation.id : null,
             driverId: availableDriver ? availableDriver.id : null,
             sellerIds: [...new Set(orderItems.map(item => {
-                const product = database.products.find(p => p.id === item.productId);
+                const product = store.find('products', 'id', item.productId);
                 return product.sellerId;
             }))],
             createdAt: new Date().toISOString(),
@@ -694,9 +860,9 @@ app.post('/api/buyer/order/create', authenticateToken, isBuyer, async (req, res)
         
         // إضافة المبلغ لحسابات البائعين
         orderItems.forEach(item => {
-            const product = database.products.find(p => p.id === item.productId);
+            const product = store.find('products', 'id', item.productId);
             if (product) {
-                const seller = database.users.find(u => u.id === product.sellerId);
+                const seller = store.find('users', 'id', product.sellerId);
                 if (seller) {
                     seller.walletBalance += item.itemPrice;
                     seller.totalSales += item.itemPrice;
@@ -726,7 +892,7 @@ app.post('/api/buyer/order/create', authenticateToken, isBuyer, async (req, res)
         // 3. لمغسلة القات إذا كانت مطلوبة
         if (washingStation && items.some(item => item.requiresWashing)) {
             await sendNotification(
-                washingStation.managerId || database.users.find(u => u.role === 'admin')?.id,
+                washingStation.managerId || store.find('users', 'role', 'admin')?.id,
                 'طلب غسل قات',
                 `طلب جديد لغسل قات برقم #${order.id}`
             );
@@ -735,7 +901,7 @@ app.post('/api/buyer/order/create', authenticateToken, isBuyer, async (req, res)
         // 4. لمندوب التوصيل
         if (availableDriver) {
             await sendNotification(
-                availableDriver.userId || database.users.find(u => u.role === 'admin')?.id,
+                availableDriver.userId || store.find('users', 'role', 'admin')?.id,
                 'طلب توصيل',
                 `طلب توصيل جديد برقم #${order.id}`
             );
@@ -758,13 +924,13 @@ app.post('/api/wallet/topup', authenticateToken, (req, res) => {
     const { amount, walletType, transactionId, phone } = req.body;
     const userId = req.user.id;
     
-    const user = database.users.find(u => u.id === userId);
+    const user = store.find('users', 'id', userId);
     if (!user) {
         return res.status(404).json({ error: 'المستخدم غير موجود' });
     }
     
     // تسجيل المعاملة
-    const transaction = {
+    let transaction = {
         id: Date.now(),
         userId,
         type: 'deposit',
@@ -777,6 +943,8 @@ app.post('/api/wallet/topup', authenticateToken, (req, res) => {
     };
     
     database.transactions.push(transaction);
+    // النسخة المتتبعة من المعاملة، حتى يُحفظ تغيير حالتها لاحقاً
+    transaction = database.transactions[database.transactions.length - 1];
     
     // في حالة حقيقية، هنا يتم التحقق من المعاملة عبر بوابة الدفع
     // ولكن في هذا المثال، نفترض أن الدفع تم بنجاح
@@ -804,7 +972,7 @@ app.post('/api/wallet/topup', authenticateToken, (req, res) => {
 app.post('/api/coupon/apply', authenticateToken, (req, res) => {
     const { code } = req.body;
     
-    const coupon = database.coupons.find(c => c.code === code);
+    const coupon = store.find('coupons', 'code', code);
     if (!coupon) {
         return res.status(404).json({ error: 'كود الخصم غير صحيح' });
     }
@@ -835,7 +1003,7 @@ app.post('/api/ad/buy', authenticateToken, isSeller, (req, res) => {
     const { packageId } = req.body;
     const sellerId = req.user.id;
     
-    const adPackage = database.packages.find(p => p.id === parseInt(packageId));
+    const adPackage = store.find('packages', 'id', parseInt(packageId));
     if (!adPackage) {
         return res.status(404).json({ error: 'الباقة غير موجودة' });
     }
@@ -844,7 +1012,7 @@ app.post('/api/ad/buy', authenticateToken, isSeller, (req, res) => {
         return res.status(400).json({ error: 'الباقة غير فعالة' });
     }
     
-    const seller = database.users.find(u => u.id === sellerId);
+    const seller = store.find('users', 'id', sellerId);
     if (!seller) {
         return res.status(404).json({ error: 'البائع غير موجود' });
     }
@@ -885,6 +1053,8 @@ app.post('/api/ad/buy', authenticateToken, isSeller, (req, res) => {
 
 // تحميل قاعدة البيانات عند بدء التشغيل
 loadDatabase();
+setInterval(reconcileStats, STATS_RECONCILE_INTERVAL).unref();
+setInterval(() => store.reloadIfReplaced(), DB_RELOAD_CHECK_INTERVAL).unref();
 
 // إنشاء مجلد النسخ الاحتياطي إذا لم يكن موجوداً
 const backupsDir = path.join(__dirname, 'backups');
@@ -0,0 +1,1215 @@
+const fs = require('fs');
+const path = require('path');
+
+// ملف قاعدة البيانات القديم بصيغة JSON
+const DEFAULT_JSON_FILE = path.join(__dirname, 'database', 'database.json');
+
+// المجموعات الافتراضية، ولكل مجموعة جدول خاص بها في SQLite
+const COLLECTIONS = [
+    'users',
+    'products',
+    'orders',
+    'markets',
+    'washingStations',
+    'drivers',
+    'advertisements',
+    'packages',
+    'wallets',
+    'transactions',
+    'notifications',
+    'coupons',
+    'backups'
+];
+
+// أعمدة جدول المجموعة: مفتاح الصف، ومعرف السجل، والسجل نفسه بصيغة JSON، ووقت
+// آخر كتابة (ms) الذي تعتمد عليه النسخ التزايدية في backup_manager.py لالتقاط التعديلات
+const TABLE_COLUMNS = ['key', 'id', 'data', 'updatedAt'];
+
+// حجم سجل التغييرات الذي يُدمج بعده في لقطة جديدة من database.json
+const JOURNAL_COMPACT_BYTES = parseInt(process.env.JOURNAL_COMPACT_BYTES, 10) || 4 * 1024 * 1024;
+
+// عدد السجلات التي تُحوَّل إلى نص في كل دفعة عند الدمج، وبين الدفعات تُعالَج الطلبات
+const COMPACT_CHUNK_RECORDS = parseInt(process.env.COMPACT_CHUNK_RECORDS, 10) || 1000;
+
+// مفتاح بيانات التخزين في database.json: أول ملف سجل بعد اللقطة، ومفاتيح الصفوف
+const SNAPSHOT_META = '_store';
+
+// ملف SQLite الذي يشير إليه Config.SQLALCHEMY_DATABASE_URI في config.py
+function defaultSqliteFile() {
+    const url = process.env.DATABASE_URL || 'sqlite:///qat_app.db';
+    if (!url.startsWith('sqlite:///')) {
+        return path.join(__dirname, 'qat_app.db');
+    }
+    
+    const file = url.slice('sqlite:///'.length);
+    return path.isAbsolute(file) ? file : path.join(__dirname, file);
+}
+
+// الكائنات والمصفوفات العادية فقط، كما ينتجها JSON.parse
+function isTrackable(value) {
+    if (value === null || typeof value !== 'object') {
+        return false;
+    }
+    const prototype = Object.getPrototypeOf(value);
+    return Array.isArray(value) || prototype === Object.prototype || prototype === null;
+}
+
+function isIndex(prop) {
+    return typeof prop === 'string' && /^(0|[1-9][0-9]*)$/.test(prop);
+}
+
+// المفتاح الناقص (undefined أو NaN) يصبح null، كما يصل في مؤشر JSON
+function sortKey(value) {
+    return value === undefined || Number.isNaN(value) ? null : value;
+}
+
+// ترتيب مفاتيح الفهارس المرتبة: القيم الناقصة أولاً، ثم حسب النوع، ثم حسب القيمة
+function compareKeys(a, b) {
+    a = sortKey(a);
+    b = sortKey(b);
+    if (a === b) {
+        return 0;
+    }
+    if (a === null) {
+        return -1;
+    }
+    if (b === null) {
+        return 1;
+    }
+    if (typeof a !== typeof b) {
+        return typeof a < typeof b ? -1 : 1;
+    }
+    return a < b ? -1 : (a > b ? 1 : 0);
+}
+
+// [المفتاح، المعرف]: المعرف يفصل بين السجلات المتساوية في المفتاح
+function compareEntries(a, b) {
+    return compareKeys(a[0], b[0]) || compareKeys(a[1], b[1]);
+}
+
+// حفظ إعادة التسمية داخل المجلد نفسه على القرص
+async function syncDirectory(directory) {
+    if (process.platform === 'win32') {
+        return;
+    }
+    
+    const handle = await fs.promises.open(directory, 'r');
+    try {
+        await handle.sync();
+    } finally {
+        await handle.close();
+    }
+}
+
+// تخزين المجموعات في SQLite: صف لكل سجل، وكل حفظ معاملة واحدة تكتب السجلات المتغيرة فقط
+class SqliteBackend {
+    constructor(file) {
+        this.file = file;
+        this.open();
+    }
+    
+    open() {
+        const Database = require('better-sqlite3');
+        
+        this.db = new Database(this.file);
+        this.db.pragma('journal_mode = WAL');
+        this.db.pragma('synchronous = NORMAL');
+        // أدوات النسخ الاحتياطي في بايثون تقرأ نفس الملف
+        this.db.pragma('busy_timeout = 5000');
+        // استعادة نسخة احتياطية تستبدل الملف بملف جديد، فيتغير رقمه على القرص
+        this.inode = fs.statSync(this.file).ino;
+        
+        this.tables = new Set();
+        this.statements = {};
+        // آخر وقت كتابة؛ يزيد دائماً حتى لو رجعت ساعة النظام
+        this.updatedAt = 0;
+        this.writeChanges = this.db.transaction((changes, updatedAt) => {
+            for (const change of changes) {
+                this.apply(change, updatedAt);
+            }
+        });
+    }
+    
+    // تحميل كل جداول المجموعات وإنشاء الجداول الناقصة
+    load(collections) {
+        const loaded = {};
+        const tables = this.db
+            .prepare("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+            .all()
+            .map(row => row.name);
+        
+        for (const name of tables) {
+            let columns = this.db.prepare(`PRAGMA table_info("${name}")`).all().map(column => column.name);
+            
+            // جداول أُنشئت قبل إضافة عمود updatedAt
+            if (columns.join() === TABLE_COLUMNS.slice(0, -1).join()) {
+                this.db.exec(`ALTER TABLE "${name}" ADD COLUMN updatedAt INTEGER`);
+                columns = TABLE_COLUMNS;
+            }
+            
+            if (columns.join() !== TABLE_COLUMNS.join()) {
+                if (collections.includes(name)) {
+                    throw new Error(`الجدول ${name} في ${this.file} ليس جدول مجموعة`);
+                }
+                continue;
+            }
+            
+            this.tables.add(name);
+            const { last } = this.db.prepare(`SELECT MAX(updatedAt) AS last FROM "${name}"`).all()[0];
+            this.updatedAt = Math.max(this.updatedAt, last || 0);
+            loaded[name] = this.db
+                .prepare(`SELECT key, data FROM "${name}" ORDER BY key`)
+                .all()
+                .map(row => ({ key: row.key, record: JSON.parse(row.data) }));
+        }
+        
+        for (const name of collections) {
+            this.ensureTable(name);
+        }
+        
+        return loaded;
+    }
+    
+    write(changes) {
+        for (const change of changes) {
+            this.ensureTable(change.collection);
+        }
+        
+        const updatedAt = Math.max(Date.now(), this.updatedAt + 1);
+        this.writeChanges(changes, updatedAt);
+        this.updatedAt = updatedAt;
+    }
+    
+    apply(change, updatedAt) {
+        const statements = this.statements[change.collection];
+        const { record } = change;
+        const id = ['number', 'string', 'bigint'].includes(typeof record.id) ? record.id : null;
+        
+        if (change.op === 'insert') {
+            statements.insert.run(change.key, id, JSON.stringify(record), updatedAt);
+        } else if (change.op === 'update') {
+            statements.update.run(id, JSON.stringify(record), updatedAt, change.key);
+        } else if (change.op === 'delete') {
+            statements.delete.run(change.key);
+        }
+    }
+    
+    ensureTable(name) {
+        if (!this.tables.has(name)) {
+            this.db.exec(`CREATE TABLE IF NOT EXISTS "${name}" (key INTEGER PRIMARY KEY, id, data TEXT NOT NULL, updatedAt INTEGER)`);
+            this.db.exec(`CREATE INDEX IF NOT EXISTS "${name}_updatedAt" ON "${name}" (updatedAt)`);
+            this.tables.add(name);
+        }
+        
+        if (!this.statements[name]) {
+            this.statements[name] = {
+                insert: this.db.prepare(`INSERT INTO "${name}" (key, id, data, updatedAt) VALUES (?, ?, ?, ?)`),
+                update: this.db.prepare(`UPDATE "${name}" SET id = ?, data = ?, updatedAt = ? WHERE key = ?`),
+                delete: this.db.prepare(`DELETE FROM "${name}" WHERE key = ?`)
+            };
+        }
+    }
+    
+    // عدد السجلات في جداول المجموعات
+    count() {
+        let total = 0;
+        for (const name of this.tables) {
+            total += this.db.prepare(`SELECT COUNT(*) AS count FROM "${name}"`).all()[0].count;
+        }
+        return total;
+    }
+    
+    // هل استُبدل الملف منذ فتحه؛ الاتصال المفتوح يكتب عندها في الملف القديم المحذوف
+    replaced() {
+        try {
+            return fs.statSync(this.file).ino !== this.inode;
+        } catch (error) {
+            return false;
+        }
+    }
+    
+    reopen() {
+        this.db.close();
+        this.open();
+    }
+    
+    close() {
+        this.db.close();
+    }
+}
+
+// تخزين المجموعات في ملف database.json مع سجل تغييرات
+//
+// كل حفظ يضيف سطراً واحداً إلى ملف سجل التغييرات (database.json.journal.<n>)
+// فيه السجلات المتغيرة: { collection, op, key, id, fields }، فتكون كلفة
+// الكتابة بحجم التغيير. عندما يتجاوز السجل JOURNAL_COMPACT_BYTES تُكتب لقطة
+// جديدة من database.json في الخلفية (ملف مؤقت ثم fsync ثم rename) وتُحذف
+// ملفات السجل التي دخلت فيها. عند التشغيل تُقرأ اللقطة ثم يُعاد تطبيق ما
+// بعدها من السجل، فانقطاع التشغيل أثناء الكتابة يفقد آخر حفظ على الأكثر.
+class JsonFileBackend {
+    constructor(file, compactBytes = JOURNAL_COMPACT_BYTES) {
+        this.file = file;
+        this.compactBytes = compactBytes;
+        // اسم المجموعة -> Map(المفتاح -> السجل) كما هي محفوظة
+        this.rows = {};
+        // رقم ملف السجل الذي تُضاف إليه التغييرات
+        this.segment = 0;
+        this.fd = null;
+        this.journalBytes = 0;
+        this.compacting = null;
+    }
+    
+    segmentPath(segment) {
+        return `${this.file}.journal.${segment}`;
+    }
+    
+    // أرقام ملفات السجل الموجودة، تصاعدياً
+    segments() {
+        const directory = path.dirname(this.file);
+        const prefix = `${path.basename(this.file)}.journal.`;
+        if (!fs.existsSync(directory)) {
+            return [];
+        }
+        
+        return fs.readdirSync(directory)
+            .filter(name => name.startsWith(prefix) && /^[0-9]+$/.test(name.slice(prefix.length)))
+            .map(name => parseInt(name.slice(prefix.length), 10))
+            .sort((a, b) => a - b);
+    }
+    
+    // هل في اللقطة أو ملفات السجل شيء، دون قراءتها أو حذف بقايا الدمج
+    hasData() {
+        return [this.file, ...this.segments().map(segment => this.segmentPath(segment))]
+            .some(file => fs.existsSync(file) && fs.statSync(file).size > 0);
+    }
+    
+    load() {
+        const text = fs.existsSync(this.file) ? fs.readFileSync(this.file, 'utf8') : '';
+        const snapshot = text.trim() ? JSON.parse(text) : {};
+        const meta = snapshot[SNAPSHOT_META] || {};
+        const keys = meta.keys || {};
+        
+        for (const [name, records] of Object.entries(snapshot)) {
+            if (Array.isArray(records)) {
+                this.rows[name] = new Map(records.map((record, index) => [keys[name] ? keys[name][index] : index + 1, record]));
+            }
+        }
+        
+        this.segment = meta.journal || 0;
+        for (const segment of this.segments()) {
+            if (segment < this.segment) {
+                // بقايا دمج انقطع بعد كتابة اللقطة
+                fs.unlinkSync(this.segmentPath(segment));
+                continue;
+            }
+            
+            this.replay(this.segmentPath(segment));
+            // الإضافة في ملف جديد، فقد ينتهي الملف السابق بسطر مبتور
+            this.segment = segment + 1;
+        }
+        
+        const loaded = {};
+        for (const [name, rows] of Object.entries(this.rows)) {
+            loaded[name] = [...rows].map(([key, record]) => ({ key, record }));
+        }
+        return loaded;
+    }
+    
+    replay(file) {
+        for (const line of fs.readFileSync(file, 'utf8').split('\n')) {
+            if (!line.trim()) {
+                continue;
+            }
+            
+            let entries;
+            try {
+                entries = JSON.parse(line);
+            } catch (error) {
+                // حفظ لم تكتمل كتابته عند انقطاع التشغيل
+                console.warn(`⚠️ تم تجاهل سطر غير مكتمل في ${file}`);
+                continue;
+            }
+            
+            for (const entry of entries) {
+                this.applyEntry(entry);
+            }
+        }
+    }
+    
+    applyEntry(entry) {
+        const rows = this.rows[entry.collection] || (this.rows[entry.collection] = new Map());
+        
+        if (entry.op === 'insert') {
+            rows.set(entry.key, entry.fields);
+        } else if (entry.op === 'update') {
+            const record = rows.get(entry.key);
+            if (record) {
+                Object.assign(record, entry.fields);
+                for (const field of entry.unset || []) {
+                    delete record[field];
+                }
+            }
+        } else if (entry.op === 'delete') {
+            rows.delete(entry.key);
+        }
+    }
+    
+    // سجل التغيير كما يُكتب في ملف السجل: السجل كاملاً عند الإضافة، والحقول المعدلة فقط عند التعديل
+    toEntry(change) {
+        const { collection, op, key, record } = change;
+        const entry = { collection, op, key, id: record.id };
+        
+        if (op === 'insert') {
+            entry.fields = record;
+        } else if (op === 'update') {
+            entry.fields = {};
+            for (const field of change.fields) {
+                if (field in record) {
+                    entry.fields[field] = record[field];
+                } else {
+                    (entry.unset || (entry.unset = [])).push(field);
+                }
+            }
+        }
+        return entry;
+    }
+    
+    write(changes) {
+        // سطر واحد لكل حفظ، فالحفظ المبتور يُتجاهل كاملاً عند إعادة التطبيق
+        const line = JSON.stringify(changes.map(change => this.toEntry(change))) + '\n';
+        
+        if (this.fd === null) {
+            this.fd = fs.openSync(this.segmentPath(this.segment), 'a');
+        }
+        fs.writeSync(this.fd, line);
+        this.journalBytes += Buffer.byteLength(line);
+        
+        for (const change of changes) {
+            const rows = this.rows[change.collection] || (this.rows[change.collection] = new Map());
+            if (change.op === 'insert') {
+                rows.set(change.key, change.record);
+            } else if (change.op === 'delete') {
+                rows.delete(change.key);
+            }
+        }
+        
+        if (this.journalBytes >= this.compactBytes && !this.compacting) {
+            this.compacting = this.compact().finally(() => {
+                this.compacting = null;
+            });
+        }
+    }
+    
+    // دمج السجل في لقطة جديدة؛ التغييرات التالية تُكتب في ملف سجل جديد أثناء ذلك
+    //
+    // تُكتب اللقطة مجموعة بعد مجموعة وعلى دفعات، فلا يتوقف الخادم طوال تحويلها إلى نص.
+    // السجل الذي يُعدَّل قبل كتابته يدخل اللقطة بقيمته الجديدة، وإعادة تطبيق ملف السجل
+    // الجديد عليها عند التحميل تعطي النتيجة نفسها
+    async compact() {
+        const previous = this.segment;
+        this.closeSegment();
+        this.segment += 1;
+        this.journalBytes = 0;
+        
+        const meta = { journal: this.segment, keys: {} };
+        const collections = [];
+        for (const [name, rows] of Object.entries(this.rows)) {
+            collections.push([name, [...rows.values()]]);
+            meta.keys[name] = [...rows.keys()];
+        }
+        const temp = `${this.file}.tmp`;
+        
+        try {
+            const handle = await fs.promises.open(temp, 'w');
+            try {
+                await handle.write(`{${JSON.stringify(SNAPSHOT_META)}:${JSON.stringify(meta)}`);
+                for (const [name, records] of collections) {
+                    await handle.write(`,${JSON.stringify(name)}:[`);
+                    for (let start = 0; start < records.length; start += COMPACT_CHUNK_RECORDS) {
+                        const chunk = records.slice(start, start + COMPACT_CHUNK_RECORDS).map(record => JSON.stringify(record));
+                        await handle.write((start ? ',' : '') + chunk.join(','));
+                    }
+                    await handle.write(']');
+                }
+                await handle.write('}\n');
+                await handle.sync();
+            } finally {
+                await handle.close();
+            }
+            
+            await fs.promises.rename(temp, this.file);
+            await syncDirectory(path.dirname(this.file));
+            
+            for (const segment of this.segments()) {
+                if (segment <= previous) {
+                    await fs.promises.unlink(this.segmentPath(segment));
+                }
+            }
+        } catch (error) {
+            // تبقى ملفات السجل، فلا تُفقد أي بيانات
+            console.error('❌ فشل دمج سجل التغييرات:', error.message);
+        }
+    }
+    
+    closeSegment() {
+        if (this.fd !== null) {
+            fs.closeSync(this.fd);
+            this.fd = null;
+        }
+    }
+    
+    // أدوات النسخ الاحتياطي لا تستبدل database.json
+    replaced() {
+        return false;
+    }
+    
+    close() {
+        this.closeSegment();
+    }
+}
+
+// فهرس على مجموعة: قيمة المفتاح -> السجلات الخام التي تحملها
+//
+// keyOf تُرجع مفتاح السجل، أو مصفوفة مفاتيح إذا كان الفهرس multi (مثل
+// order.sellerIds). ترتيب السجلات في كل قيمة هو ترتيب إضافتها إلى المجموعة.
+class HashIndex {
+    constructor(keyOf, options = {}) {
+        this.keyOf = keyOf;
+        this.multi = Boolean(options.multi);
+        this.buckets = new Map();
+        // السجل الخام -> مفاتيحه الحالية في الفهرس
+        this.entries = new Map();
+        this.stale = true;
+    }
+    
+    update(record) {
+        this.remove(record);
+        this.add(record);
+    }
+    
+    add(record) {
+        const keys = this.multi ? [...new Set(this.keyOf(record) || [])] : [this.keyOf(record)];
+        
+        for (const key of keys) {
+            let bucket = this.buckets.get(key);
+            if (!bucket) {
+                bucket = new Set();
+                this.buckets.set(key, bucket);
+            }
+            bucket.add(record);
+        }
+        this.entries.set(record, keys);
+    }
+    
+    remove(record) {
+        const keys = this.entries.get(record);
+        if (!keys) {
+            return;
+        }
+        
+        for (const key of keys) {
+            const bucket = this.buckets.get(key);
+            bucket.delete(record);
+            if (bucket.size === 0) {
+                this.buckets.delete(key);
+            }
+        }
+        this.entries.delete(record);
+    }
+    
+    rebuild(records) {
+        this.buckets.clear();
+        this.entries.clear();
+        for (const record of records) {
+            if (isTrackable(record)) {
+                this.add(record);
+            }
+        }
+        this.stale = false;
+    }
+    
+    get(key) {
+        return this.buckets.get(key) || new Set();
+    }
+}
+
+// فهرس مرتب على مجموعة حسب [keyOf(السجل)، id]، للتصفح بمؤشر (keyset)
+//
+// الإضافة والحذف بحث ثنائي ثم splice، والتصفح يبدأ من المؤشر مباشرة.
+class SortedIndex {
+    constructor(keyOf) {
+        this.keyOf = keyOf;
+        this.records = [];
+        // السجل الخام -> [المفتاح، المعرف] الحالي
+        this.entries = new Map();
+        this.stale = true;
+    }
+    
+    entryOf(record) {
+        return [sortKey(this.keyOf(record)), sortKey(record.id)];
+    }
+    
+    // أول موضع مدخله >= entry، أو > entry إذا كان after
+    position(entry, after = false) {
+        let low = 0;
+        let high = this.records.length;
+        while (low < high) {
+            const middle = (low + high) >> 1;
+            const order = compareEntries(this.entries.get(this.records[middle]), entry);
+            if (order < 0 || (after && order === 0)) {
+                low = middle + 1;
+            } else {
+                high = middle;
+            }
+        }
+        return low;
+    }
+    
+    // تعديل لا يغير مفتاح السجل (مثل الكمية) لا يحركه
+    update(record) {
+        const entry = this.entries.get(record);
+        if (!entry || compareEntries(entry, this.entryOf(record)) !== 0) {
+            this.remove(record);
+            this.add(record);
+        }
+    }
+    
+    add(record) {
+        this.remove(record);
+        const entry = this.entryOf(record);
+        this.records.splice(this.position(entry, true), 0, record);
+        this.entries.set(record, entry);
+    }
+    
+    remove(record) {
+        const entry = this.entries.get(record);
+        if (!entry) {
+            return;
+        }
+        
+        let index = this.position(entry);
+        while (this.records[index] !== record) {
+            index++;
+        }
+        this.records.splice(index, 1);
+        this.entries.delete(record);
+    }
+    
+    rebuild(records) {
+        this.entries.clear();
+        for (const record of records) {
+            if (isTrackable(record)) {
+                this.entries.set(record, this.entryOf(record));
+            }
+        }
+        this.records = [...this.entries.keys()].sort((a, b) => compareEntries(this.entries.get(a), this.entries.get(b)));
+        this.stale = false;
+    }
+    
+    // السجلات بعد المدخل after بالترتيب، أو قبله إذا كان reverse
+    *range(after, reverse) {
+        if (reverse) {
+            const start = after ? this.position(after) : this.records.length;
+            for (let index = start - 1; index >= 0; index--) {
+                yield this.records[index];
+            }
+        } else {
+            const start = after ? this.position(after, true) : 0;
+            for (let index = start; index < this.records.length; index++) {
+                yield this.records[index];
+            }
+        }
+    }
+    
+    // ترتيب مجموعة جزئية من السجلات بالطريقة نفسها، مع تطبيق المؤشر
+    order(records, after, reverse) {
+        const sign = reverse ? -1 : 1;
+        return records
+            .map(record => [record, this.entryOf(record)])
+            .filter(([, entry]) => !after || sign * compareEntries(entry, after) > 0)
+            .sort((a, b) => sign * compareEntries(a[1], b[1]))
+            .map(([record]) => record);
+    }
+}
+
+// مجموع محدَّث على مجموعة، مثل عدد البائعين أو مجموع مبالغ الطلبات
+//
+// valueOf تُرجع مساهمة السجل: رقماً، أو شرطاً يُحسب 1 إذا تحقق.
+class SumAggregate {
+    constructor(valueOf) {
+        this.valueOf = valueOf;
+        // السجل الخام -> مساهمته الحالية في المجموع
+        this.entries = new Map();
+        this.value = 0;
+        this.stale = true;
+    }
+    
+    update(record) {
+        this.add(record);
+    }
+    
+    add(record) {
+        this.remove(record);
+        // القيم غير الرقمية (undefined أو NaN أو Infinity) تُحسب صفراً، وإلا أفسدت المجموع كله؛
+        // ويبقى السجل في entries حتى يُعاد حسابه إذا عُدِّلت قيمته
+        let value = Number(this.valueOf(record));
+        if (!Number.isFinite(value)) {
+            value = 0;
+        }
+        this.entries.set(record, value);
+        this.value += value;
+    }
+    
+    remove(record) {
+        if (this.entries.has(record)) {
+            this.value -= this.entries.get(record);
+            this.entries.delete(record);
+        }
+    }
+    
+    rebuild(records) {
+        this.entries.clear();
+        this.value = 0;
+        for (const record of records) {
+            if (isTrackable(record)) {
+                this.add(record);
+            }
+        }
+        this.stale = false;
+    }
+}
+
+// متتبع التغييرات
+//
+// تُغلَّف المجموعات وسجلاتها بـ Proxy، فكل push أو splice على مجموعة وكل
+// تعديل على سجل (ولو في حقل متداخل مثل order.items) يُسجَّل. عند save تُرسل
+// السجلات المضافة والمعدلة والمحذوفة فقط إلى التخزين، فتكون كلفة الحفظ
+// بحجم التغيير لا بحجم قاعدة البيانات. السجلات المضافة بـ push تُحفظ من
+// قائمة الإضافات مباشرة؛ أما splice والحذف وإعادة تعيين المجموعة فتُقارَن
+// عندها المجموعة كاملة بما حُفظ لمعرفة المحذوف.
+//
+// التعديلات تُتتبع عبر السجلات المقروءة من database؛ الكائن الذي أُضيف إلى
+// مجموعة ثم عُدِّل عبر مرجعه الأصلي بعد حفظه لا يُرصد تعديله.
+//
+// استعادة نسخة احتياطية من backup_manager.py تستبدل ملف qat_app.db. كل حفظ،
+// و reloadIfReplaced التي يستدعيها الخادم دورياً، يتحقق من ذلك أولاً: يُفتح
+// الملف الجديد ويُعاد تحميل البيانات منه، وتُهمل التغييرات التي لم تُحفظ بعد
+// لأنها بُنيت على البيانات السابقة للاستعادة.
+//
+// الفهارس (createIndex) تُحدَّث مع كل push وكل تعديل على سجل، فيكون البحث
+// بالمعرف أو البريد أو البائع O(1) بدل المرور على المجموعة كاملة. أما
+// splice وحذف العناصر وإعادة تعيين المجموعة فتجعل فهارسها قديمة، وتُبنى من
+// جديد عند أول بحث بعدها. الفهارس المرتبة ({ sorted: true }) والمجاميع
+// (createAggregate) تُحدَّث بالطريقة نفسها.
+class Store {
+    constructor(backend) {
+        this.backend = backend;
+        // المصفوفات الخام لكل مجموعة
+        this.collections = {};
+        // السجلات كما حُفظت آخر مرة: اسم المجموعة -> Map(المفتاح -> السجل)
+        this.rows = {};
+        this.nextKey = {};
+        // السجل الخام -> { collection, key }
+        this.keys = new WeakMap();
+        // المجموعات التي حُذف منها أو أعيد ترتيبها، فتُقارن كاملة عند الحفظ
+        this.dirtyCollections = new Set();
+        // اسم المجموعة -> السجلات المضافة إلى نهايتها منذ آخر حفظ
+        this.appended = new Map();
+        // السجل الخام -> أسماء الحقول المعدلة
+        this.dirtyRecords = new Map();
+        this.proxies = new WeakMap();
+        this.targets = new WeakMap();
+        // اسم المجموعة -> { اسم الفهرس -> HashIndex }
+        this.indexes = {};
+        // اسم المجموعة -> { اسم المجموع -> SumAggregate }
+        this.aggregates = {};
+        // السجل الخام -> اسم المجموعة التي أُضيف إليها
+        this.owners = new WeakMap();
+        this.data = this.rootProxy();
+    }
+    
+    load() {
+        const loaded = this.backend.load(COLLECTIONS);
+        
+        for (const name of new Set([...COLLECTIONS, ...Object.keys(loaded)])) {
+            const rows = loaded[name] || [];
+            
+            this.collections[name] = rows.map(row => row.record);
+            this.rows[name] = new Map(rows.map(row => [row.key, row.record]));
+            this.nextKey[name] = rows.reduce((max, row) => Math.max(max, row.key), 0) + 1;
+            
+            for (const row of rows) {
+                this.keys.set(row.record, { collection: name, key: row.key });
+            }
+            this.invalidate(name);
+        }
+        
+        return this.data;
+    }
+    
+    // كتابة التغييرات منذ آخر حفظ؛ إذا فشلت الكتابة تبقى معلقة للحفظ التالي
+    save() {
+        if (this.reloadIfReplaced()) {
+            return [];
+        }
+        
+        const changes = [];
+        const inserted = new Set();
+        const nextKey = {};
+        
+        for (const name of this.dirtyCollections) {
+            const rows = this.rows[name] || new Map();
+            const present = new Set();
+            nextKey[name] = this.nextKey[name] || 1;
+            
+            for (const record of this.collections[name] || []) {
+                if (!isTrackable(record)) {
+                    continue;
+                }
+                
+                const info = this.keys.get(record);
+                if (info && info.collection === name && rows.get(info.key) === record) {
+                    present.add(info.key);
+                } else if (!inserted.has(record)) {
+                    inserted.add(record);
+                    changes.push({ collection: name, op: 'insert', key: nextKey[name]++, record });
+                }
+            }
+            
+            for (const [key, record] of rows) {
+                if (!present.has(key)) {
+                    changes.push({ collection: name, op: 'delete', key, record });
+                }
+            }
+        }
+        
+        // مجموعات لم يتغير فيها إلا ما أضيف إلى نهايتها
+        for (const [name, records] of this.appended) {
+            if (this.dirtyCollections.has(name)) {
+                continue;
+            }
+            
+            const rows = this.rows[name] || new Map();
+            nextKey[name] = this.nextKey[name] || 1;
+            
+            for (const record of records) {
+                const info = this.keys.get(record);
+                const stored = info && info.collection === name && rows.get(info.key) === record;
+                if (!stored && !inserted.has(record)) {
+                    inserted.add(record);
+                    changes.push({ collection: name, op: 'insert', key: nextKey[name]++, record });
+                }
+            }
+        }
+        
+        for (const [record, fields] of this.dirtyRecords) {
+            const info = this.keys.get(record);
+            const rows = info && this.rows[info.collection];
+            
+            if (rows && rows.get(info.key) === record && !inserted.has(record)) {
+                changes.push({ collection: info.collection, op: 'update', key: info.key, record, fields: [...fields] });
+            }
+        }
+        
+        if (changes.length) {
+            this.backend.write(changes);
+        }
+        
+        for (const change of changes) {
+            const rows = this.rows[change.collection] || (this.rows[change.collection] = new Map());
+            
+            if (change.op === 'insert') {
+                rows.set(change.key, change.record);
+                this.keys.set(change.record, { collection: change.collection, key: change.key });
+            } else if (change.op === 'delete') {
+                rows.delete(change.key);
+            }
+        }
+        
+        Object.assign(this.nextKey, nextKey);
+        this.dirtyCollections.clear();
+        this.appended.clear();
+        this.dirtyRecords.clear();
+        
+        return changes;
+    }
+    
+    close() {
+        this.backend.close();
+    }
+    
+    reloadIfReplaced() {
+        if (!this.backend.replaced()) {
+            return false;
+        }
+        
+        const pending = this.dirtyCollections.size + this.appended.size + this.dirtyRecords.size;
+        console.warn(`⚠️ تم استبدال ${this.backend.file} (استعادة نسخة احتياطية)، سيُعاد تحميل البيانات منه`);
+        if (pending > 0) {
+            console.warn('⚠️ تم تجاهل تغييرات لم تُحفظ قبل الاستعادة');
+        }
+        
+        this.backend.reopen();
+        for (const name of Object.keys(this.collections)) {
+            delete this.collections[name];
+        }
+        this.rows = {};
+        this.nextKey = {};
+        this.keys = new WeakMap();
+        this.owners = new WeakMap();
+        this.dirtyCollections.clear();
+        this.appended.clear();
+        this.dirtyRecords.clear();
+        for (const collection of new Set([...Object.keys(this.indexes), ...Object.keys(this.aggregates)])) {
+            this.invalidate(collection);
+        }
+        
+        this.load();
+        return true;
+    }
+    
+    queueInsert(collection, record) {
+        let records = this.appended.get(collection);
+        if (!records) {
+            records = [];
+            this.appended.set(collection, records);
+        }
+        records.push(record);
+    }
+    
+    markRecord(record, field) {
+        let fields = this.dirtyRecords.get(record);
+        if (!fields) {
+            fields = new Set();
+            this.dirtyRecords.set(record, fields);
+        }
+        fields.add(field);
+        this.reindex(record);
+    }
+    
+    createIndex(collection, name, keyOf, options = {}) {
+        const indexes = this.indexes[collection] || (this.indexes[collection] = {});
+        indexes[name] = options.sorted ? new SortedIndex(keyOf) : new HashIndex(keyOf, options);
+    }
+    
+    index(collection, name) {
+        const index = this.indexes[collection] && this.indexes[collection][name];
+        if (!index) {
+            throw new Error(`لا يوجد فهرس ${name} على المجموعة ${collection}`);
+        }
+        return this.refresh(collection, index);
+    }
+    
+    createAggregate(collection, name, valueOf) {
+        const aggregates = this.aggregates[collection] || (this.aggregates[collection] = {});
+        aggregates[name] = new SumAggregate(valueOf);
+    }
+    
+    aggregate(collection, name) {
+        const aggregate = this.aggregates[collection] && this.aggregates[collection][name];
+        if (!aggregate) {
+            throw new Error(`لا يوجد مجموع ${name} على المجموعة ${collection}`);
+        }
+        return this.refresh(collection, aggregate).value;
+    }
+    
+    // إعادة بناء كل المجاميع من المجموعات، وإرجاع ما اختلف عن القيمة المحدَّثة
+    // (تعديل سجل عبر مرجعه الأصلي مثلاً لا يمر بالـ Proxy)
+    reconcile() {
+        const drift = [];
+        
+        for (const [collection, aggregates] of Object.entries(this.aggregates)) {
+            for (const [name, aggregate] of Object.entries(aggregates)) {
+                const before = aggregate.stale ? null : aggregate.value;
+                aggregate.stale = true;
+                const after = this.refresh(collection, aggregate).value;
+                
+                // فروق تقريب الأعداد العشرية ليست انحرافاً، أما المجموع غير الرقمي فانحراف دائماً
+                if (before !== null && (!Number.isFinite(before) || Math.abs(before - after) > 1e-9 * Math.max(1, Math.abs(after)))) {
+                    drift.push({ collection, name, before, after });
+                }
+            }
+        }
+        
+        return drift;
+    }
+    
+    // إعادة بناء فهرس أو مجموع قديم من المجموعة
+    refresh(collection, view) {
+        if (view.stale) {
+            const records = this.collections[collection] || [];
+            for (const record of records) {
+                if (isTrackable(record)) {
+                    this.owners.set(record, collection);
+                }
+            }
+            view.rebuild(records);
+        }
+        return view;
+    }
+    
+    // الفهارس والمجاميع المعرفة على مجموعة
+    views(collection) {
+        return [
+            ...Object.values(this.indexes[collection] || {}),
+            ...Object.values(this.aggregates[collection] || {})
+        ];
+    }
+    
+    // أول سجل قيمة مفتاحه key، مثل database.users.find(u => u.email === key)
+    find(collection, name, key) {
+        for (const record of this.index(collection, name).get(key)) {
+            return this.recordProxy(record, record, null);
+        }
+        return undefined;
+    }
+    
+    // كل السجلات التي قيمة مفتاحها key
+    filter(collection, name, key) {
+        return [...this.index(collection, name).get(key)].map(record => this.recordProxy(record, record, null));
+    }
+    
+    // السجلات مرتبة حسب فهرس مرتب، بدءاً من بعد المدخل options.after؛ مع
+    // options.records تُرتب هذه السجلات فقط (مثل نتيجة filter على فهرس آخر)
+    *range(collection, name, options = {}) {
+        const index = this.index(collection, name);
+        const records = options.records
+            ? index.order(options.records.map(record => this.unwrap(record)), options.after, options.reverse)
+            : index.range(options.after, options.reverse);
+        
+        for (const record of records) {
+            yield this.recordProxy(record, record, null);
+        }
+    }
+    
+    // إعادة حساب مفاتيح سجل عُدِّل في فهارس مجموعته
+    reindex(record) {
+        const collection = this.owners.get(record);
+        if (!collection) {
+            return;
+        }
+        
+        for (const view of this.views(collection)) {
+            if (!view.stale && view.entries.has(record)) {
+                view.update(record);
+            }
+        }
+    }
+    
+    // إضافة سجل إلى نهاية مجموعة
+    indexRecord(collection, record) {
+        this.owners.set(record, collection);
+        for (const view of this.views(collection)) {
+            if (!view.stale) {
+                view.add(record);
+            }
+        }
+    }
+    
+    invalidate(collection) {
+        for (const view of this.views(collection)) {
+            view.stale = true;
+        }
+    }
+    
+    // إزالة الـ Proxy من قيمة قبل تخزينها، حتى لا يُخزَّن غلاف سجل داخل سجل آخر
+    unwrap(value) {
+        if (value === null || typeof value !== 'object') {
+            return value;
+        }
+        
+        const target = this.targets.get(value);
+        if (target) {
+            return target;
+        }
+        
+        if (isTrackable(value)) {
+            for (const key of Object.keys(value)) {
+                const child = value[key];
+                if (child !== null && typeof child === 'object') {
+                    const raw = this.unwrap(child);
+                    if (raw !== child) {
+                        value[key] = raw;
+                    }
+                }
+            }
+        }
+        return value;
+    }
+    
+    wrap(target, handler) {
+        let proxy = this.proxies.get(target);
+        if (!proxy) {
+            proxy = new Proxy(target, handler);
+            this.proxies.set(target, proxy);
+            this.targets.set(proxy, target);
+        }
+        return proxy;
+    }
+    
+    rootProxy() {
+        const store = this;
+        
+        return new Proxy(this.collections, {
+            get(target, prop) {
+                const value = target[prop];
+                return Array.isArray(value) ? store.collectionProxy(prop, value) : value;
+            },
+            set(target, prop, value) {
+                target[prop] = store.unwrap(value);
+                store.dirtyCollections.add(prop);
+                store.invalidate(prop);
+                return true;
+            },
+            deleteProperty(target, prop) {
+                delete target[prop];
+                store.dirtyCollections.add(prop);
+                store.invalidate(prop);
+                return true;
+            }
+        });
+    }
+    
+    collectionProxy(name, records) {
+        const store = this;
+        
+        return this.wrap(records, {
+            get(target, prop, receiver) {
+                const value = Reflect.get(target, prop, receiver);
+                return isIndex(prop) && isTrackable(value) ? store.recordProxy(value, value, null) : value;
+            },
+            set(target, prop, value) {
+                // push يضيف إلى النهاية فيُحدَّث الفهرس مباشرة؛ غير ذلك يعيد بناءه
+                const appended = isIndex(prop) && Number(prop) === target.length;
+                const shrunk = prop === 'length' && value < target.length;
+                if ((isIndex(prop) && !appended) || shrunk) {
+                    store.invalidate(name);
+                }
+                
+                target[prop] = store.unwrap(value);
+                if (appended && isTrackable(target[prop])) {
+                    store.indexRecord(name, target[prop]);
+                    store.queueInsert(name, target[prop]);
+                } else if ((isIndex(prop) && !appended) || shrunk) {
+                    store.dirtyCollections.add(name);
+                }
+                return true;
+            },
+            deleteProperty(target, prop) {
+                delete target[prop];
+                store.dirtyCollections.add(name);
+                store.invalidate(name);
+                return true;
+            }
+        });
+    }
+    
+    // سجل أو كائن متداخل فيه؛ field هو الحقل الأعلى في السجل الذي يحتويه
+    recordProxy(value, record, field) {
+        const store = this;
+        
+        return this.wrap(value, {
+            get(target, prop, receiver) {
+                const child = Reflect.get(target, prop, receiver);
+                if (typeof prop === 'symbol' || !isTrackable(child)) {
+                    return child;
+                }
+                return store.recordProxy(child, record, field === null ? prop : field);
+            },
+            set(target, prop, child) {
+                target[prop] = store.unwrap(child);
+                store.markRecord(record, field === null ? prop : field);
+                return true;
+            },
+            deleteProperty(target, prop) {
+                delete target[prop];
+                store.markRecord(record, field === null ? prop : field);
+                return true;
+            }
+        });
+    }
+}
+
+// فتح قاعدة البيانات: SQLite إن كانت مكتبة better-sqlite3 مثبتة، وإلا ملف database.json
+function openStore(options = {}) {
+    const jsonFile = options.jsonFile || DEFAULT_JSON_FILE;
+    let backend;
+    
+    try {
+        backend = new SqliteBackend(options.sqliteFile || defaultSqliteFile());
+    } catch (error) {
+        if (error.code !== 'MODULE_NOT_FOUND' || !error.message.includes('better-sqlite3')) {
+            throw error;
+        }
+        console.warn('⚠️ مكتبة better-sqlite3 غير مثبتة، سيتم استخدام ملف database.json');
+        backend = new JsonFileBackend(jsonFile);
+    }
+    
+    const store = new Store(backend);
+    store.load();
+    
+    if (backend instanceof SqliteBackend) {
+        if (backend.count() === 0 && new JsonFileBackend(jsonFile).hasData()) {
+            console.warn(`⚠️ قاعدة البيانات ${backend.file} فارغة بينما يحتوي ${jsonFile} على بيانات، شغّل: npm run migrate`);
+        }
+    }
+    
+    return store;
+}
+
+// نقل البيانات مرة واحدة من database.json إلى جداول SQLite
+function migrateJsonToSqlite(jsonFile = DEFAULT_JSON_FILE, sqliteFile = defaultSqliteFile()) {
+    const source = new JsonFileBackend(jsonFile).load();
+    const backend = new SqliteBackend(sqliteFile);
+    
+    try {
+        const existing = backend.load(COLLECTIONS);
+        const filled = Object.keys(existing).filter(name => existing[name].length > 0);
+        if (filled.length > 0) {
+            throw new Error(`${sqliteFile} يحتوي على بيانات بالفعل في: ${filled.join(', ')}`);
+        }
+        
+        const changes = [];
+        const counts = {};
+        for (const [name, rows] of Object.entries(source)) {
+            counts[name] = rows.length;
+            for (const row of rows) {
+                changes.push({ collection: name, op: 'insert', key: row.key, record: row.record });
+            }
+        }
+        
+        backend.write(changes);
+        return counts;
+    } finally {
+        backend.close();
+    }
+}
+
+if (require.main === module) {
+    const [command, jsonFile, sqliteFile] = process.argv.slice(2);
+    
+    if (command !== 'migrate') {
+        console.error('الاستخدام: node store.js migrate [database.json] [qat_app.db]');
+        process.exit(1);
+    }
+    
+    try {
+        const counts = migrateJsonToSqlite(jsonFile || DEFAULT_JSON_FILE, sqliteFile || defaultSqliteFile());
+        for (const [name, count] of Object.entries(counts)) {
+            console.log(`✅ ${name}: ${count}`);
+        }
+    } catch (error) {
+        console.error(`❌ فشل نقل البيانات: ${error.message}`);
+        process.exit(1);
+    }
+}
+
+module.exports = {
+    COLLECTIONS,
+    Store,
+    SqliteBackend,
+    JsonFileBackend,
+    openStore,
+    migrateJsonToSqlite,
+    defaultSqliteFile
+};